@@ -17,7 +17,8 @@ class CustomUserAdmin(UserAdmin):
     change_password_form = AdminPasswordChangeForm
     model = User
 
-    list_display = ('id', 'username', 'first_name', 'last_name', 'email',)
+    list_display = ('id', 'username', 'first_name', 'last_name', 'email',
+                    'recipes_count', 'subscribers_count',)
     list_filter = ('username',)
 
     fieldsets = (
@@ -34,6 +34,20 @@ class User(AbstractUser):
         null=True,
         blank=True,
     )
+    avatar_variants = models.JSONField(
+        verbose_name='Уменьшенные копии аватара',
+        default=dict,
+        blank=True,
+        editable=False,
+    )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Количество рецептов',
+        default=0,
+    )
+    subscribers_count = models.PositiveIntegerField(
+        verbose_name='Количество подписчиков',
+        default=0,
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', ]
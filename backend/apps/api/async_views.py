@@ -0,0 +1,112 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import redirect
+from django.utils.cache import patch_cache_control
+from rest_framework.renderers import JSONRenderer
+
+from apps.recipe.reference import reference_data
+from apps.recipe.search import aautocomplete_ingredients
+from apps.recipe.short_links import decode_code, live_recipes
+from .response_cache import (acached_json_response, arecipe_detail_key,
+                             arecipe_list_key, json_response)
+from .serializers import IngredientSerializer, TagSerializer
+from .views import (IngredientView, RecipesViewSet, TagView,
+                    autocomplete_limit, reference_list_payload)
+
+# Синхронные DRF-представления для запросов, которые нельзя обработать
+# без аутентификации, фильтров или записи.
+sync_tag_list = TagView.as_view(
+    {'get': 'list'}, basename='tags', detail=False)
+sync_autocomplete = IngredientView.as_view(
+    {'get': 'autocomplete'}, basename='ingredients', detail=False)
+sync_recipe_list = RecipesViewSet.as_view(
+    {'get': 'list', 'post': 'create'}, basename='recipes', detail=False)
+sync_recipe_detail = RecipesViewSet.as_view(
+    {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update',
+     'delete': 'destroy'}, basename='recipes', detail=True)
+
+
+def wants_json(request):
+    """GET-запрос, на который DRF тоже ответил бы JSON."""
+    return (request.method == 'GET'
+            and request.GET.get('format', 'json') == 'json'
+            and 'text/html' not in request.headers.get('Accept', ''))
+
+
+def is_anonymous(request):
+    return 'HTTP_AUTHORIZATION' not in request.META
+
+
+def csrf_exempt_async(view):
+    """csrf_exempt для асинхронных представлений.
+
+    В Django 4.2 декоратор их не поддерживает. CSRF для запросов
+    с записью проверяет DRF, которому они передаются.
+    """
+    view.csrf_exempt = True
+    return view
+
+
+@csrf_exempt_async
+async def tag_list(request):
+    """Список тэгов из снимка справочников без похода в DRF."""
+    if not wants_json(request):
+        return await sync_to_async(sync_tag_list)(request)
+    snapshot = await reference_data.aget()
+    return json_response(request, *reference_list_payload(
+        snapshot, TagSerializer, 'tags'))
+
+
+@csrf_exempt_async
+async def ingredient_autocomplete(request):
+    """Подсказки ингредиентов через асинхронный ORM."""
+    if not wants_json(request):
+        return await sync_to_async(sync_autocomplete)(request)
+    ingredients = await aautocomplete_ingredients(
+        request.GET.get('name', ''), autocomplete_limit(request.GET))
+    return HttpResponse(
+        JSONRenderer().render(
+            IngredientSerializer(ingredients, many=True).data),
+        content_type='application/json')
+
+
+@csrf_exempt_async
+async def recipe_list(request):
+    """Список рецептов: анонимам из кэша, остальное через DRF."""
+    if wants_json(request) and is_anonymous(request):
+        response = await acached_json_response(
+            request, await arecipe_list_key(request))
+        if response is not None:
+            return response
+    return await sync_to_async(sync_recipe_list)(request)
+
+
+@csrf_exempt_async
+async def recipe_detail(request, pk):
+    """Рецепт: анонимам из кэша, остальное через DRF."""
+    if wants_json(request) and is_anonymous(request):
+        response = await acached_json_response(
+            request, await arecipe_detail_key(pk))
+        if response is not None:
+            return response
+    return await sync_to_async(sync_recipe_detail)(request, pk=str(pk))
+
+
+async def redirect_to_recipe(request, code):
+    """Редирект по короткой ссылке без запроса к базе.
+
+    Существование рецепта проверяется по битовой карте live_recipes,
+    ответ можно кэшировать на стороне nginx.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponse(status=405, headers={'Allow': 'GET, HEAD'})
+    recipe_id = decode_code(code)
+    if recipe_id is None or not await live_recipes.acontains(recipe_id):
+        return JsonResponse(
+            [f'Рецепт с кодом {code} не существует'], safe=False,
+            status=400)
+    response = redirect(f'/recipes/{recipe_id}/')
+    patch_cache_control(
+        response, public=True, max_age=settings.SHORT_LINK_CACHE_TIMEOUT)
+    return response
@@ -0,0 +1,126 @@
+import copy
+import logging
+import time
+from collections import Counter, OrderedDict
+from threading import BoundedSemaphore, Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from apps.recipe.versions import AUTH_VERSION, bump_version, get_versions
+
+logger = logging.getLogger(__name__)
+
+
+class TokenCache:
+    """Пользователи по ключу токена: LRU в процессе и общий кэш.
+
+    Записи LRU действительны, пока не сменилась версия AUTH_VERSION,
+    она увеличивается при каждой инвалидации. В stats считаются
+    попадания в каждый уровень и промахи; каждые stats_every обращений
+    счетчики процесса пишутся в лог.
+    """
+
+    def __init__(self, size, timeout, stats_every=None):
+        self.size = size
+        self.timeout = timeout
+        self.stats_every = stats_every
+        self.stats = Counter()
+        self._items = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def cache_key(key):
+        return f'auth_token_{key}'
+
+    def version(self):
+        return get_versions(AUTH_VERSION)[AUTH_VERSION]
+
+    def get(self, key, version):
+        with self._lock:
+            item = self._items.get(key)
+            if (item is not None and item[0] == version
+                    and item[1] > time.monotonic()):
+                self._items.move_to_end(key)
+                self._count('local_hits')
+                return copy.copy(item[2])
+        user = cache.get(self.cache_key(key))
+        with self._lock:
+            self._count('misses' if user is None else 'shared_hits')
+        if user is None:
+            return None
+        self._remember(key, version, user)
+        return copy.copy(user)
+
+    def _count(self, name):
+        """Учет обращения; вызывается под self._lock."""
+        self.stats[name] += 1
+        total = sum(self.stats.values())
+        if self.stats_every and total % self.stats_every == 0:
+            logger.info('Кэш токенов: обращений %d, в процессе %d, '
+                        'в общем кэше %d, промахов %d', total,
+                        self.stats['local_hits'], self.stats['shared_hits'],
+                        self.stats['misses'])
+
+    def set(self, key, user, version):
+        """Запись, если с момента чтения не было инвалидации."""
+        if self.version() != version:
+            return
+        cache.set(self.cache_key(key), user, self.timeout)
+        self._remember(key, version, user)
+
+    def _remember(self, key, version, user):
+        with self._lock:
+            self._items[key] = (version, time.monotonic() + self.timeout,
+                                copy.copy(user))
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def invalidate(self, *keys):
+        cache.delete_many([self.cache_key(key) for key in keys])
+        bump_version(AUTH_VERSION)
+        with self._lock:
+            for key in keys:
+                self._items.pop(key, None)
+
+
+token_cache = TokenCache(settings.AUTH_TOKEN_CACHE_SIZE,
+                         settings.AUTH_TOKEN_CACHE_TIMEOUT,
+                         settings.AUTH_TOKEN_CACHE_STATS_EVERY)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Аутентификация по токену без запроса к базе при попадании в кэш."""
+
+    def authenticate_credentials(self, key):
+        version = token_cache.version()
+        user = token_cache.get(key, version)
+        if user is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, user, version)
+            return user, token
+        if not user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+        return user, Token(key=key, user=user)
+
+
+password_slots = BoundedSemaphore(settings.LOGIN_HASH_CONCURRENCY)
+
+
+def check_password_bounded(user, password):
+    """Проверка пароля не более чем в LOGIN_HASH_CONCURRENCY потоках.
+
+    Устаревший хэш пересчитывается и сохраняется. None, если слот
+    не освободился за LOGIN_HASH_TIMEOUT секунд.
+    """
+    if not password_slots.acquire(timeout=settings.LOGIN_HASH_TIMEOUT):
+        return None
+    try:
+        return user.check_password(password)
+    finally:
+        password_slots.release()
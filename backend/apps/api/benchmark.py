@@ -0,0 +1,159 @@
+import random
+import socket
+import statistics
+import time
+from contextlib import contextmanager
+from threading import Thread
+
+import uvicorn
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.asgi import get_asgi_application
+from django.core.servers.basehttp import (ThreadedWSGIServer,
+                                          WSGIRequestHandler,
+                                          get_internal_wsgi_application)
+from django.db import connection, reset_queries, transaction
+
+from apps.recipe.models import Ingredient, Recipe, RecipeIngredient, Tag
+from apps.recipe.reference import reference_data
+
+User = get_user_model()
+
+SEED_BATCH_SIZE = 1000
+
+
+@contextmanager
+def rolled_back():
+    """Транзакция, которая всегда откатывается: данные замера не остаются.
+
+    Снимок справочников сбрасывается до и после, чтобы в нем были тэги
+    замера и не осталось их после отката.
+    """
+    with transaction.atomic():
+        try:
+            yield
+        finally:
+            transaction.set_rollback(True)
+            reference_data.invalidate()
+
+
+def seed_recipes(count, tags=3, ingredients=20, tags_per_recipe=2,
+                 ingredients_per_recipe=5, seed=0):
+    """Автор, тэги, ингредиенты и count его рецептов через bulk_create."""
+    generator = random.Random(seed)
+    author = User.objects.create_user(
+        email='benchmark@example.com', username='benchmark',
+        first_name='Benchmark', last_name='Benchmark')
+    tags = Tag.objects.bulk_create([
+        Tag(name=f'benchmark {number}', slug=f'benchmark-{number}')
+        for number in range(tags)
+    ])
+    ingredients = Ingredient.objects.bulk_create([
+        Ingredient(name=f'benchmark {number}', measurement_unit='г')
+        for number in range(ingredients)
+    ])
+    for start in range(0, count, SEED_BATCH_SIZE):
+        recipes = Recipe.objects.bulk_create([
+            Recipe(author=author, name=f'Рецепт {number}', text='Описание',
+                   cooking_time=generator.randint(1, 120),
+                   image='recipes/images/benchmark.png')
+            for number in range(start, min(start + SEED_BATCH_SIZE, count))
+        ])
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe=recipe, tag=tag)
+            for recipe in recipes
+            for tag in generator.sample(tags, tags_per_recipe)
+        ])
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                             amount=generator.randint(1, 500))
+            for recipe in recipes
+            for ingredient in generator.sample(ingredients,
+                                               ingredients_per_recipe)
+        ])
+    reference_data.invalidate()
+    return author, tags
+
+
+def remove_seed():
+    """Удаление данных seed_recipes, сохраненных в базе."""
+    User.objects.filter(email='benchmark@example.com').delete()
+    Tag.objects.filter(slug__startswith='benchmark-').delete()
+    Ingredient.objects.filter(name__startswith='benchmark ').delete()
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def serve_asgi():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    server = uvicorn.Server(uvicorn.Config(
+        get_asgi_application(), lifespan='off', log_level='warning'))
+    thread = Thread(target=server.run, kwargs={'sockets': [sock]},
+                    daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError('uvicorn не запустился.')
+        time.sleep(0.01)
+    try:
+        yield f'http://127.0.0.1:{sock.getsockname()[1]}'
+    finally:
+        server.should_exit = True
+        thread.join()
+        sock.close()
+
+
+@contextmanager
+def serve():
+    """Сервер проекта в потоке этого процесса, отдает базовый URL.
+
+    При SERVER_MODE=asgi это uvicorn, иначе многопоточный WSGI-сервер
+    Django. Запросы проходят полный цикл обработчика, в том числе
+    закрытие соединений с базой по CONN_MAX_AGE после ответа.
+    """
+    if settings.ASGI_MODE:
+        with serve_asgi() as url:
+            yield url
+        return
+    server = ThreadedWSGIServer(('127.0.0.1', 0), QuietRequestHandler)
+    server.set_app(get_internal_wsgi_application())
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_port}'
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def measure(function, repeat):
+    """Время каждого из repeat вызовов и число запросов одного вызова."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    reset_queries()
+    connection.force_debug_cursor = True
+    try:
+        function()
+    finally:
+        connection.force_debug_cursor = False
+    return timings, len(connection.queries)
+
+
+def latency(timings):
+    """p50 и p99 в миллисекундах."""
+    percentiles = statistics.quantiles(timings, n=100, method='inclusive')
+    return (f'p50 {percentiles[49] * 1000:.2f} мс, '
+            f'p99 {percentiles[98] * 1000:.2f} мс')
+
+
+def describe(timings, queries):
+    """p50 и p99 в миллисекундах и число запросов."""
+    return f'{latency(timings)}, запросов {queries}'
@@ -0,0 +1,181 @@
+import json
+import shutil
+import time
+import zipfile
+from contextlib import contextmanager
+from itertools import islice
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from apps.recipe.counters import change_counter
+from apps.recipe.images import schedule_recipe_variants
+from apps.recipe.ingredient_index import ingredient_index
+from apps.recipe.models import Recipe, RecipeIngredient
+from apps.recipe.short_links import live_recipes
+from apps.recipe.signals import bump_recipes
+from .fields import DecodedImageFile
+from .serializers import ImportRecipeSerializer
+
+User = get_user_model()
+
+ROWS_SUFFIXES = ('.ndjson', '.jsonl')
+
+
+def read_ndjson(lines):
+    """Строки NDJSON с номерами, пустые строки пропускаются."""
+    for number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if line.strip():
+            try:
+                yield number, json.loads(line)
+            except ValueError:
+                yield number, None
+
+
+@contextmanager
+def open_recipe_rows(file):
+    """Рецепты из NDJSON-файла или zip-архива с NDJSON и картинками.
+
+    Поле image может быть строкой base64, именем файла внутри архива
+    или путем картинки рецепта в хранилище, как в выгрузке без картинок.
+    Картинки из архива и хранилища копируются во временные файлы
+    по одной.
+    """
+    if not zipfile.is_zipfile(file):
+        file.seek(0)
+        yield (attach_image(number, row)
+               for number, row in read_ndjson(file))
+        return
+    with zipfile.ZipFile(file) as archive:
+        names = [name for name in archive.namelist()
+                 if name.endswith(ROWS_SUFFIXES)]
+        if not names:
+            raise ValueError('В архиве нет файла рецептов .ndjson.')
+
+        def rows():
+            with archive.open(names[0]) as lines:
+                for number, row in read_ndjson(lines):
+                    yield attach_image(number, row, archive)
+
+        yield rows()
+
+
+def attach_image(number, row, archive=None):
+    """Замена имени картинки в строке на копию файла."""
+    image = row.get('image') if isinstance(row, dict) else None
+    if not isinstance(image, str) or image.startswith('data:'):
+        return number, row
+    if archive is not None and image in archive.NameToInfo:
+        info = archive.getinfo(image)
+        with archive.open(info) as source:
+            row['image'] = copy_image(source, image, info.file_size)
+    elif (image.startswith(Recipe.image.field.upload_to)
+          and default_storage.exists(image)):
+        with default_storage.open(image) as source:
+            row['image'] = copy_image(source, image, source.size)
+    return number, row
+
+
+def copy_image(source, name, size):
+    file = DecodedImageFile(PurePosixPath(name).name, None, size)
+    shutil.copyfileobj(source, file)
+    file.seek(0)
+    return file
+
+
+class RecipeImporter:
+    """Пакетный импорт рецептов одного автора.
+
+    Строки проверяются тем же сериализатором, что и при создании
+    рецепта через API, а валидные записываются через bulk_create
+    в транзакции на каждую пачку.
+    """
+
+    def __init__(self, author, batch_size=settings.IMPORT_BATCH_SIZE):
+        self.author = author
+        self.batch_size = batch_size
+
+    def run(self, rows):
+        """Импорт строк (номер, данные), возвращает отчет."""
+        report = {'created': 0, 'errors': []}
+        started = time.perf_counter()
+        rows = iter(rows)
+        while batch := list(islice(rows, self.batch_size)):
+            valid = []
+            for number, row in batch:
+                if not isinstance(row, dict):
+                    report['errors'].append(
+                        {'line': number, 'errors': 'Некорректный JSON.'})
+                    continue
+                serializer = ImportRecipeSerializer(data=row)
+                if serializer.is_valid():
+                    valid.append(serializer.validated_data)
+                else:
+                    report['errors'].append(
+                        {'line': number, 'errors': serializer.errors})
+            if valid:
+                report['created'] += self.write(valid)
+        elapsed = time.perf_counter() - started
+        report['seconds'] = round(elapsed, 2)
+        report['recipes_per_second'] = round(report['created'] / elapsed)
+        return report
+
+    def write(self, items):
+        with transaction.atomic():
+            recipes = Recipe.objects.bulk_create([
+                Recipe(author=self.author, name=item['name'],
+                       text=item['text'], image=item['image'],
+                       cooking_time=item['cooking_time'])
+                for item in items
+            ])
+            RecipeIngredient.objects.bulk_create([
+                RecipeIngredient(recipe=recipe,
+                                 ingredient=ingredient['ingredient'],
+                                 amount=ingredient['amount'])
+                for recipe, item in zip(recipes, items)
+                for ingredient in item['ingredients']
+            ])
+            Recipe.tags.through.objects.bulk_create([
+                Recipe.tags.through(recipe=recipe, tag=tag)
+                for recipe, item in zip(recipes, items)
+                for tag in item['tags']
+            ])
+            # bulk_create не отправляет post_save, счетчик меняется здесь.
+            change_counter(User.objects.filter(pk=self.author.pk),
+                           'recipes_count', len(recipes))
+            bump_recipes()
+            transaction.on_commit(live_recipes.invalidate)
+            ingredient_index.changed(*(recipe.pk for recipe in recipes))
+            for recipe in recipes:
+                schedule_recipe_variants(recipe)
+        return len(recipes)
+
+
+def export_recipes(queryset):
+    """Потоковая выгрузка рецептов в NDJSON в формате импорта.
+
+    В image пишется путь картинки в хранилище: импорт в тот же проект
+    копирует файл, а архив с картинками кладет их под теми же путями.
+    """
+    recipes = queryset.order_by('id').prefetch_related(
+        'tags', 'recipe_ingredients').iterator(
+            chunk_size=settings.EXPORT_CHUNK_SIZE)
+    for recipe in recipes:
+        yield json.dumps({
+            'id': recipe.id,
+            'author': recipe.author_id,
+            'name': recipe.name,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+            'image': recipe.image.name,
+            'tags': [tag.id for tag in recipe.tags.all()],
+            'ingredients': [
+                {'id': item.ingredient_id, 'amount': item.amount}
+                for item in recipe.recipe_ingredients.all()
+            ],
+        }, ensure_ascii=False) + '\n'
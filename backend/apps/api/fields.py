@@ -0,0 +1,115 @@
+import base64
+import binascii
+import os
+import tempfile
+import uuid
+import weakref
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+from PIL import Image
+from rest_framework import serializers
+
+IMAGE_EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+
+
+class DecodedImageFile(TemporaryUploadedFile):
+    """Декодированная картинка во временном файле.
+
+    Хранилище может переместить файл вместо копирования, поэтому
+    удаляется он только если еще существует.
+    """
+
+    def __init__(self, name, content_type, size):
+        file = tempfile.NamedTemporaryFile(
+            suffix='.upload', dir=settings.FILE_UPLOAD_TEMP_DIR, delete=False)
+        UploadedFile.__init__(self, file, name, content_type, size, None)
+        weakref.finalize(self, remove_if_exists, file.name)
+
+    def close(self):
+        super().close()
+        remove_if_exists(self.file.name)
+
+
+def remove_if_exists(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def decode_base64_chunks(payload, offset, chunk_size):
+    """Декодирование base64 по частям, пробельные символы пропускаются."""
+    tail = ''
+    for start in range(offset, len(payload), chunk_size):
+        chunk = tail + ''.join(payload[start:start + chunk_size].split())
+        cut = len(chunk) - len(chunk) % 4
+        yield base64.b64decode(chunk[:cut], validate=True)
+        tail = chunk[cut:]
+    if tail:
+        raise binascii.Error('Incorrect padding')
+
+
+class Base64ImageField(serializers.ImageField):
+    """Картинка строкой base64 или файлом из multipart/form-data.
+
+    Размер проверяется до декодирования, base64 пишется во временный
+    файл частями, а размеры картинки читаются из заголовка.
+    """
+
+    default_error_messages = {
+        'invalid_base64': 'Некорректная строка base64.',
+        'too_large': 'Размер изображения больше {max_size} байт.',
+        'too_big': 'Стороны изображения должны быть не больше {max_side} px.',
+        'invalid_format': 'Допустимые форматы: {formats}.',
+    }
+
+    def to_internal_value(self, data):
+        if data == '':
+            return None
+        if isinstance(data, str):
+            data = self.decode(data)
+        elif not isinstance(data, UploadedFile):
+            self.fail('invalid')
+        elif data.size > settings.IMAGE_UPLOAD_MAX_SIZE:
+            self.fail('too_large', max_size=settings.IMAGE_UPLOAD_MAX_SIZE)
+        self.check_header(data)
+        return super().to_internal_value(data)
+
+    def decode(self, data):
+        content_type, offset = None, 0
+        if data.startswith('data:'):
+            offset = data.find(';base64,', 0, 256) + len(';base64,')
+            if offset < len(';base64,'):
+                self.fail('invalid_base64')
+            content_type = data[len('data:'):offset - len(';base64,')]
+        size = (len(data) - offset) * 3 // 4 - data[-2:].count('=')
+        if size > settings.IMAGE_UPLOAD_MAX_SIZE:
+            self.fail('too_large', max_size=settings.IMAGE_UPLOAD_MAX_SIZE)
+        file = DecodedImageFile(str(uuid.uuid4()), content_type, size)
+        try:
+            for chunk in decode_base64_chunks(
+                    data, offset, settings.IMAGE_UPLOAD_CHUNK_SIZE):
+                file.write(chunk)
+        except (binascii.Error, ValueError):
+            file.close()
+            self.fail('invalid_base64')
+        file.size = file.tell()
+        file.seek(0)
+        return file
+
+    def check_header(self, file):
+        try:
+            with Image.open(file) as image:
+                image_format, (width, height) = image.format, image.size
+        except (OSError, Image.DecompressionBombError):
+            self.fail('invalid_image')
+        finally:
+            file.seek(0)
+        if image_format not in IMAGE_EXTENSIONS:
+            self.fail('invalid_format', formats=', '.join(IMAGE_EXTENSIONS))
+        max_side = settings.IMAGE_UPLOAD_MAX_SIDE
+        if width > max_side or height > max_side:
+            self.fail('too_big', max_side=max_side)
+        if isinstance(file, DecodedImageFile) and '.' not in file.name:
+            file.name = f'{file.name}.{IMAGE_EXTENSIONS[image_format]}'
@@ -1,7 +1,15 @@
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import (
-    CharFilter, FilterSet, ModelMultipleChoiceFilter, NumberFilter)
+    CharFilter, FilterSet, MultipleChoiceFilter, NumberFilter)
+from rest_framework.filters import OrderingFilter
 
-from apps.recipe.models import Ingredient, Recipe, Tag
+from apps.recipe.models import Ingredient, Recipe
+from apps.recipe.reference import reference_data
+
+
+def tag_choices():
+    """Слаги тэгов из кэша справочников."""
+    return [(slug, slug) for slug in reference_data.get().tags_by_slug]
 
 
 class IngredientFilter(FilterSet):
@@ -17,9 +25,7 @@ class IngredientFilter(FilterSet):
 class RecipeFilter(FilterSet):
     """Фильтр рецептов."""
 
-    tags = ModelMultipleChoiceFilter(field_name='tags__slug',
-                                     queryset=Tag.objects.all(),
-                                     to_field_name='slug',)
+    tags = MultipleChoiceFilter(choices=tag_choices, method='filter_tags')
     is_favorited = NumberFilter(method='filter_is_favorited')
     is_in_shopping_cart = NumberFilter(method='filter_is_in_shopping_cart',
                                        field_name='is_in_shopping_cart')
@@ -28,6 +34,15 @@ class RecipeFilter(FilterSet):
         model = Recipe
         fields = ('author', 'tags')
 
+    def filter_tags(self, queryset, name, value):
+        """Фильтрация рецептов по слагам тэгов."""
+        tags_by_slug = reference_data.get().tags_by_slug
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'),
+            tag__in=[tags_by_slug[slug].id for slug in value
+                     if slug in tags_by_slug],
+        )))
+
     def filter_is_favorited(self, queryset, name, value):
         """Фильтрация рецептов, добавленных в избранное."""
         user = self.request.user
@@ -41,3 +56,13 @@ class RecipeFilter(FilterSet):
         if value and user.is_authenticated:
             return queryset.filter(in_shopping_cart__user_id=user.id)
         return queryset
+
+
+class RecipeOrderingFilter(OrderingFilter):
+    """Сортировка рецептов, при равенстве новые рецепты идут первыми."""
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if ordering and not {'created_at', '-created_at'} & set(ordering):
+            ordering = (*ordering, '-created_at')
+        return ordering
@@ -0,0 +1,30 @@
+import time
+
+from django.contrib.auth.hashers import check_password, get_hashers
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Скорость проверки паролей на одно ядро для каждого алгоритма'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seconds', type=float, default=2,
+            help='Время замера для одного алгоритма.')
+
+    def handle(self, *args, **options):
+        password = 'benchmark-password'
+        for hasher in get_hashers():
+            try:
+                encoded = hasher.encode(password, hasher.salt())
+            except ValueError as error:
+                self.stdout.write(f'{hasher.algorithm}: пропущен ({error}).')
+                continue
+            checks, started = 0, time.perf_counter()
+            while time.perf_counter() - started < options['seconds']:
+                check_password(password, encoded)
+                checks += 1
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'{hasher.algorithm}: {checks / elapsed:.1f} входов/с '
+                'на ядро')
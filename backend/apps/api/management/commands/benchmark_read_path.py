@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from apps.api.benchmark import describe, measure, rolled_back, seed_recipes
+from apps.api.serializers import ReadRecipeSerializer
+from apps.recipe.models import Recipe
+from foodgram.settings import ITEMS_ON_PAGE
+
+
+class Command(BaseCommand):
+    help = ('Задержка чтения ленты и рецепта без плана предзагрузки связей '
+            'и с ним; данные замера откатываются')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=5000,
+                            help='Сколько рецептов создать для замера.')
+        parser.add_argument('--repeat', type=int, default=200,
+                            help='Число замеров для каждого варианта.')
+        parser.add_argument('--limit', type=int, default=ITEMS_ON_PAGE,
+                            help='Размер страницы ленты.')
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            author, _ = seed_recipes(options['recipes'])
+            request = Request(APIRequestFactory().get(
+                '/api/recipes/', HTTP_HOST=settings.ALLOWED_HOSTS[0]))
+            request.user = author
+            context = {'request': request}
+            page_ids = list(Recipe.objects.order_by('-created_at', '-id')
+                            .values_list('id', flat=True)[:options['limit']])
+            plans = {
+                'без плана': Recipe.objects.all(),
+                'с планом': Recipe.objects.with_related(),
+            }
+            for name, queryset in plans.items():
+                queryset = queryset.with_user_flags(author)
+                page = queryset.filter(id__in=page_ids)
+                detail = queryset.filter(id=page_ids[0])
+                for path, recipes in (('лента', page), ('рецепт', detail)):
+                    timings, queries = measure(
+                        lambda: ReadRecipeSerializer(
+                            recipes.all(), many=True, context=context).data,
+                        options['repeat'])
+                    self.stdout.write(
+                        f'{path}, {name}: {describe(timings, queries)}')
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.http import QueryDict
+
+from apps.api.benchmark import describe, measure, rolled_back, seed_recipes
+from apps.api.filters import RecipeFilter
+from apps.recipe.models import Recipe
+from foodgram.settings import ITEMS_ON_PAGE
+
+
+class Command(BaseCommand):
+    help = ('Фильтр ленты по нескольким тэгам: JOIN с DISTINCT против '
+            'EXISTS; данные замера откатываются')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100000,
+                            help='Сколько рецептов создать для замера.')
+        parser.add_argument('--tags', type=int, default=3,
+                            help='Сколько тэгов выбрать в фильтре.')
+        parser.add_argument('--repeat', type=int, default=50,
+                            help='Число замеров для каждого варианта.')
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            _, tags = seed_recipes(options['recipes'],
+                                   tags=options['tags'] * 2)
+            slugs = [tag.slug for tag in tags[:options['tags']]]
+            data = QueryDict(mutable=True)
+            data.setlist('tags', slugs)
+            variants = {
+                'JOIN с DISTINCT': lambda: Recipe.objects.filter(
+                    tags__slug__in=slugs).distinct(),
+                'EXISTS': lambda: RecipeFilter(
+                    data, queryset=Recipe.objects.all()).qs,
+            }
+            duplicates = Recipe.objects.filter(tags__slug__in=slugs).count()
+            for name, build in variants.items():
+                # Страница ленты и общее количество, как в ответе API.
+                timings, queries = measure(
+                    lambda: (list(build().order_by('-created_at')
+                                  [:ITEMS_ON_PAGE]), build().count()),
+                    options['repeat'])
+                self.stdout.write(f'{name}: {describe(timings, queries)}, '
+                                  f'рецептов {build().count()}')
+            self.stdout.write(f'JOIN без DISTINCT вернул бы {duplicates} '
+                              'строк.')
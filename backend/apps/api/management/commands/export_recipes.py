@@ -0,0 +1,44 @@
+import shutil
+import sys
+import zipfile
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from apps.api.bulk import export_recipes
+from apps.recipe.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Выгрузка рецептов в NDJSON или zip-архив с картинками'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', help='Файл выгрузки, по умолчанию stdout.')
+        parser.add_argument(
+            '--with-images', action='store_true',
+            help='Собрать zip-архив с recipes.ndjson и картинками.')
+
+    def handle(self, *args, **options):
+        rows = export_recipes(Recipe.objects.all())
+        if not options['with_images']:
+            output = (open(options['output'], 'w', encoding='utf-8')
+                      if options['output'] else sys.stdout)
+            try:
+                output.writelines(rows)
+            finally:
+                if output is not sys.stdout:
+                    output.close()
+            return
+        path = options['output'] or 'recipes.zip'
+        with zipfile.ZipFile(path, 'w') as archive:
+            with archive.open('recipes.ndjson', 'w') as ndjson:
+                for row in rows:
+                    ndjson.write(row.encode('utf-8'))
+            images = Recipe.objects.exclude(image='').values_list(
+                'image', flat=True).distinct().iterator()
+            for name in images:
+                with default_storage.open(name) as image:
+                    with archive.open(name, 'w') as target:
+                        shutil.copyfileobj(image, target)
+        self.stderr.write(self.style.SUCCESS(f'Архив записан в {path}.'))
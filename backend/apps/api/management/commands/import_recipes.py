@@ -0,0 +1,41 @@
+import zipfile
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.api.bulk import RecipeImporter, open_recipe_rows
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Импорт рецептов из NDJSON или zip-архива с картинками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл .ndjson или .zip.')
+        parser.add_argument(
+            '--author', required=True, help='Email автора рецептов.')
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.IMPORT_BATCH_SIZE,
+            help='Количество рецептов в одной транзакции.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+        author = User.objects.filter(email=options['author']).first()
+        if author is None:
+            raise CommandError(f'Автор {options["author"]} не найден.')
+        importer = RecipeImporter(author, options['batch_size'])
+        try:
+            with open(options['path'], 'rb') as file:
+                with open_recipe_rows(file) as rows:
+                    report = importer.run(rows)
+        except (OSError, ValueError, zipfile.BadZipFile) as error:
+            raise CommandError(error)
+        for error in report['errors']:
+            self.stderr.write(f'Строка {error["line"]}: {error["errors"]}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Рецептов: {report["created"]}, ошибок: '
+            f'{len(report["errors"])}. {report["seconds"]} с '
+            f'({report["recipes_per_second"]} рецептов/с).'))
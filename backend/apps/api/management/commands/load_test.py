@@ -0,0 +1,138 @@
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+import requests
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from rest_framework.authtoken.models import Token
+
+from apps.api.benchmark import latency, remove_seed, seed_recipes, serve
+from apps.recipe.models import Recipe
+from apps.recipe.short_links import live_recipes
+from apps.recipe.versions import RECIPES_VERSION, bump_version
+from foodgram.settings import ITEMS_ON_PAGE
+
+User = get_user_model()
+
+MAX_DETAIL_PATHS = 50
+MAX_LIST_PAGES = 10
+
+
+def read_paths():
+    """Смесь частых запросов на чтение: тэги, страницы ленты, рецепты."""
+    recipe_ids = list(Recipe.objects.order_by('-created_at').values_list(
+        'id', flat=True)[:MAX_DETAIL_PATHS])
+    if not recipe_ids:
+        raise CommandError('Нет рецептов: загрузите данные командой load_db '
+                           'или задайте --seed.')
+    pages = min(MAX_LIST_PAGES,
+                max(1, Recipe.objects.count() // ITEMS_ON_PAGE))
+    return [
+        '/api/tags/',
+        *(f'/api/recipes/?page={page}' for page in range(1, pages + 1)),
+        *(f'/api/recipes/{recipe_id}/' for recipe_id in recipe_ids),
+    ]
+
+
+def run(url, paths, total, concurrency, headers):
+    """Общее время и пары (задержка, статус) для total запросов."""
+    def worker(number):
+        session = requests.Session()
+        session.headers.update(headers)
+        results = []
+        for index in range(number, total, concurrency):
+            path = paths[index % len(paths)]
+            started = time.perf_counter()
+            try:
+                status = session.get(url + path).status_code
+            except requests.ConnectionError:
+                # Например, перезапуск воркера gunicorn по max_requests.
+                status = None
+            results.append((time.perf_counter() - started, status))
+        return results
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = [item for part in executor.map(worker, range(concurrency))
+                   for item in part]
+    return time.perf_counter() - started, results
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест чтения API: запросы в секунду, задержки и '
+            'число новых соединений с базой')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url', help='Адрес запущенного сервера, например '
+                          'http://127.0.0.1:8080. Без него сервер проекта '
+                          '(WSGI или ASGI по SERVER_MODE) запускается '
+                          'в этом процессе.')
+        parser.add_argument('--requests', type=int, default=2000,
+                            help='Число замеряемых запросов.')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Число одновременных клиентов.')
+        parser.add_argument('--warmup', type=int, default=200,
+                            help='Запросы до замера, прогрев кэшей.')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Создать столько рецептов на время теста.')
+        parser.add_argument(
+            '--user', help='Почта пользователя, от имени которого идут '
+                           'запросы (при --seed это benchmark@example.com); '
+                           'без нее запросы анонимные.')
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            with transaction.atomic():
+                seed_recipes(options['seed'])
+            bump_version(RECIPES_VERSION)
+            live_recipes.invalidate()
+        try:
+            self.load(options)
+        finally:
+            if options['seed']:
+                with transaction.atomic():
+                    remove_seed()
+
+    def load(self, options):
+        paths = read_paths()
+        headers = {}
+        if options['user']:
+            user = User.objects.filter(email=options['user']).first()
+            if user is None:
+                raise CommandError(f'Нет пользователя {options["user"]}.')
+            token, _ = Token.objects.get_or_create(user=user)
+            headers['Authorization'] = f'Token {token.key}'
+        connections = Counter()
+
+        def count_connection(connection, **kwargs):
+            connections[connection.alias] += 1
+
+        server = nullcontext(options['url']) if options['url'] else serve()
+        with server as url:
+            run(url, paths, options['warmup'], options['concurrency'],
+                headers)
+            connection_created.connect(count_connection)
+            try:
+                elapsed, results = run(url, paths, options['requests'],
+                                       options['concurrency'], headers)
+            finally:
+                connection_created.disconnect(count_connection)
+        timings = [timing for timing, _ in results]
+        errors = sum(status != 200 for _, status in results)
+        self.stdout.write(
+            f'{"Пользователь" if headers else "Аноним"}, '
+            f'клиентов {options["concurrency"]}, запросов {len(results)}: '
+            f'{len(results) / elapsed:.1f} в секунду, {latency(timings)}, '
+            f'ошибок {errors}')
+        if not options['url']:
+            max_age = settings.DATABASES['default'].get('CONN_MAX_AGE', 0)
+            self.stdout.write(
+                f'{"ASGI" if settings.ASGI_MODE else "WSGI"}, '
+                f'CONN_MAX_AGE {max_age}, новых соединений с базой: '
+                f'{sum(connections.values())}')
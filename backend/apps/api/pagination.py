@@ -1,11 +1,162 @@
-from rest_framework import pagination
+import hashlib
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 
-from foodgram.settings import ITEMS_ON_PAGE
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework import exceptions, pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from foodgram.settings import COUNT_CACHE_TIMEOUT, ITEMS_ON_PAGE
 
 
 class Pagination(pagination.PageNumberPagination):
-    """Класс пагинации страниц."""
+    """Класс пагинации страниц.
+
+    Если в запросе есть параметр cursor и для пагинатора задан
+    cursor_ordering, страницы выбираются по ключу (keyset) без OFFSET,
+    а общее количество берется из кэша. Другая сортировка, чем
+    cursor_ordering, в этом режиме не поддерживается.
+    """
 
     page_size = ITEMS_ON_PAGE
     max_page_size = ITEMS_ON_PAGE
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    cursor_ordering = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = bool(
+            self.cursor_ordering
+            and self.cursor_query_param in request.query_params)
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        self.check_ordering(request)
+        page_size = self.get_page_size(request)
+        self.count = self.get_cached_count(queryset)
+        cursor = self.decode_cursor(request, queryset.model)
+        reverse = cursor is not None and cursor['reverse']
+        ordering = self.cursor_ordering
+        if reverse:
+            ordering = tuple(field[1:] if field.startswith('-') else
+                             f'-{field}' for field in ordering)
+        queryset = queryset.order_by(*ordering)
+        if cursor is not None:
+            queryset = queryset.filter(
+                self.keyset_filter(ordering, cursor['values']))
+        page = list(queryset[:page_size + 1])
+        has_more = len(page) > page_size
+        page = page[:page_size]
+        if reverse:
+            page.reverse()
+        self.next_position = self.previous_position = None
+        if page and (has_more or reverse):
+            self.next_position = self.position(page[-1])
+        if page and (has_more if reverse else cursor is not None):
+            self.previous_position = self.position(page[0])
+        return page
+
+    def check_ordering(self, request):
+        """Запрошенная сортировка должна быть началом cursor_ordering."""
+        ordering = [
+            field.strip() for field in request.query_params.get(
+                api_settings.ORDERING_PARAM, '').split(',')
+            if field.strip()
+        ]
+        if ordering != list(self.cursor_ordering[:len(ordering)]):
+            raise exceptions.ValidationError({
+                api_settings.ORDERING_PARAM: (
+                    'С параметром cursor доступна только сортировка '
+                    f'{",".join(self.cursor_ordering)}.')
+            })
+
+    def get_cached_count(self, queryset):
+        query = str(queryset.order_by().query).encode()
+        key = f'pagination_count_{hashlib.md5(query).hexdigest()}'
+        return cache.get_or_set(key, queryset.count, COUNT_CACHE_TIMEOUT)
+
+    def keyset_filter(self, ordering, values):
+        """Условие «после позиции» для сортировки по нескольким полям."""
+        names = [field.lstrip('-') for field in ordering]
+        condition = Q()
+        for position, field in enumerate(ordering):
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            step = Q(**{f'{names[position]}__{lookup}': values[position]})
+            for name, value in zip(names[:position], values):
+                step &= Q(**{name: value})
+            condition |= step
+        return condition
+
+    def position(self, obj):
+        return [getattr(obj, field.lstrip('-'))
+                for field in self.cursor_ordering]
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params[self.cursor_query_param]
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode()))
+            if len(cursor['values']) != len(self.cursor_ordering):
+                raise ValueError
+            cursor['values'] = [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.cursor_ordering,
+                                        cursor['values'])
+            ]
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound('Неверный курсор.')
+        return cursor
+
+    def encode_cursor(self, values, reverse):
+        payload = json.dumps({
+            'values': [value.isoformat() if hasattr(value, 'isoformat')
+                       else value for value in values],
+            'reverse': reverse,
+        })
+        url = remove_query_param(self.request.build_absolute_uri(),
+                                 self.page_query_param)
+        return replace_query_param(
+            url, self.cursor_query_param,
+            urlsafe_b64encode(payload.encode()).decode())
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position, reverse=False)
+
+    def get_previous_link(self):
+        if not self.cursor_mode:
+            return super().get_previous_link()
+        if self.previous_position is None:
+            return None
+        return self.encode_cursor(self.previous_position, reverse=True)
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response({
+            'count': self.count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class RecipePagination(Pagination):
+    """Пагинация ленты рецептов, курсор по (created_at, id)."""
+
+    cursor_ordering = ('-created_at', '-id')
+
+
+class SubscriptionPagination(Pagination):
+    """Пагинация подписок, курсор по (username, id)."""
+
+    cursor_ordering = ('username', 'id')
@@ -0,0 +1,72 @@
+import csv
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """Базовый формат выгрузки списка покупок.
+
+    Сам список отдается потоком через stream(), render() нужен только
+    для ответов с ошибками.
+    """
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return JSONRenderer().render(data)
+
+    def stream(self, items):
+        """Построчная выгрузка позиций, отсортированных по единицам."""
+        raise NotImplementedError
+
+
+class TextShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, items):
+        unit = None
+        for num, item in enumerate(items, start=1):
+            if item['measurement_unit'] != unit:
+                unit = item['measurement_unit']
+                yield f'{"" if num == 1 else chr(10)}[{unit}]\n'
+            yield f'{num}. {item["name"]} - {item["amount"]} {unit}.\n'
+
+
+class _Echo:
+    """Буфер для csv.writer, который сразу возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, items):
+        writer = csv.writer(_Echo())
+        yield writer.writerow(('measurement_unit', 'name', 'amount'))
+        for item in items:
+            yield writer.writerow(
+                (item['measurement_unit'], item['name'], item['amount']))
+
+
+class JSONShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+    def stream(self, items):
+        unit = None
+        for item in items:
+            if item['measurement_unit'] != unit:
+                yield '{' if unit is None else '],'
+                unit = item['measurement_unit']
+                yield f'{json.dumps(unit, ensure_ascii=False)}: ['
+            else:
+                yield ','
+            yield json.dumps(
+                {'name': item['name'], 'amount': item['amount']},
+                ensure_ascii=False)
+        yield '{}' if unit is None else ']}'
@@ -0,0 +1,144 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+
+from apps.recipe.versions import (RECIPES_VERSION, REFERENCE_VERSION,
+                                  aget_versions, author_version,
+                                  get_versions, recipe_version)
+
+# Параметры, от которых зависит ответ списка рецептов.
+RECIPE_LIST_PARAMS = ('author', 'cursor', 'is_favorited',
+                      'is_in_shopping_cart', 'limit', 'ordering', 'page',
+                      'tags')
+
+
+def make_etag(payload):
+    return f'"{hashlib.sha1(payload).hexdigest()}"'
+
+
+def json_response(request, payload, etag):
+    """JSON-ответ из готовых байтов с поддержкой If-None-Match."""
+    response = HttpResponse(payload, content_type='application/json')
+    response['ETag'] = etag
+    return get_conditional_response(request, etag=etag, response=response)
+
+
+def _recipe_list_key(versions, params, host):
+    # Изменение автора с рецептами увеличивает RECIPES_VERSION.
+    query = '&'.join(
+        f'{name}={",".join(sorted(params.getlist(name)))}'
+        for name in RECIPE_LIST_PARAMS if name in params
+    )
+    return (f'recipe_list:{versions[RECIPES_VERSION]}:'
+            f'{versions[REFERENCE_VERSION]}:{host}:{query}')
+
+
+def _recipe_detail_key(versions, recipe_id):
+    return (f'recipe_detail:{recipe_id}:'
+            f'{versions[recipe_version(recipe_id)]}:'
+            f'{versions[REFERENCE_VERSION]}')
+
+
+def recipe_list_key(request):
+    """Ключ кэша списка рецептов по нормализованной строке запроса."""
+    versions = get_versions(RECIPES_VERSION, REFERENCE_VERSION)
+    return _recipe_list_key(versions, request.GET, request.get_host())
+
+
+def recipe_detail_key(recipe_id):
+    """Ключ кэша рецепта по его версии и версии справочников.
+
+    Версия автора хранится вместе с ответом, см. author_dependencies.
+    """
+    versions = get_versions(recipe_version(recipe_id), REFERENCE_VERSION)
+    return _recipe_detail_key(versions, recipe_id)
+
+
+async def arecipe_list_key(request):
+    versions = await aget_versions(RECIPES_VERSION, REFERENCE_VERSION)
+    return _recipe_list_key(versions, request.GET, request.get_host())
+
+
+async def arecipe_detail_key(recipe_id):
+    versions = await aget_versions(
+        recipe_version(recipe_id), REFERENCE_VERSION)
+    return _recipe_detail_key(versions, recipe_id)
+
+
+def author_dependencies(data):
+    """Версия автора, данные которого встроены в представление рецепта."""
+    return get_versions(author_version(data['author']['id']))
+
+
+def cached_json_response(request, key, build, dependencies=None):
+    """Ответ из кэша; при промахе он строится через build() и сохраняется.
+
+    dependencies(data) возвращает версии, с которыми сохраняется ответ;
+    если какая-то из них с тех пор изменилась, ответ строится заново.
+    """
+    cached = cache.get(key)
+    if cached is not None and cached[2] and (
+            get_versions(*cached[2]) != cached[2]):
+        cached = None
+    if cached is None:
+        response = build()
+        if response.status_code != status.HTTP_200_OK:
+            return response
+        payload = JSONRenderer().render(response.data)
+        cached = (payload, make_etag(payload),
+                  dependencies(response.data) if dependencies else {})
+        cache.set(key, cached, settings.RESPONSE_CACHE_TIMEOUT)
+    return json_response(request, *cached[:2])
+
+
+async def acached_json_response(request, key):
+    """Ответ из кэша или None, если его там нет или он устарел."""
+    cached = await cache.aget(key)
+    if cached is None or cached[2] and (
+            await aget_versions(*cached[2]) != cached[2]):
+        return None
+    return json_response(request, *cached[:2])
+
+
+def get_recipe_bodies(request, recipe_ids, build):
+    """Общие для всех пользователей представления рецептов по id.
+
+    Отсутствующие в кэше строятся через build(ids) одним запросом.
+    Тело хранится с версией автора и устаревает вместе с ней.
+    """
+    version_keys = {
+        recipe_id: recipe_version(recipe_id) for recipe_id in recipe_ids}
+    versions = get_versions(*version_keys.values(), REFERENCE_VERSION)
+    keys = {
+        recipe_id: (f'recipe_body:{recipe_id}:{versions[key]}:'
+                    f'{versions[REFERENCE_VERSION]}:{request.get_host()}')
+        for recipe_id, key in version_keys.items()
+    }
+    cached = cache.get_many(keys.values())
+    authors = get_versions(*{
+        author_version(body['author']['id'])
+        for _, body in cached.values()})
+    bodies = {
+        recipe_id: cached[key][1] for recipe_id, key in keys.items()
+        if key in cached and authors[author_version(
+            cached[key][1]['author']['id'])] == cached[key][0]
+    }
+    missing = [recipe_id for recipe_id in recipe_ids
+               if recipe_id not in bodies]
+    if missing:
+        built = build(missing)
+        authors = get_versions(*{
+            author_version(body['author']['id'])
+            for body in built.values()})
+        cache.set_many({
+            keys[recipe_id]: (
+                authors[author_version(body['author']['id'])], body)
+            for recipe_id, body in built.items()
+        }, settings.RESPONSE_CACHE_TIMEOUT)
+        bodies.update(built)
+    return bodies
@@ -1,19 +1,47 @@
-from drf_extra_fields.fields import Base64ImageField
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
+from django.core.files.storage import default_storage
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
+from django.db import transaction
+from django.db.models import prefetch_related_objects
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator, UniqueValidator
 
+from apps.api.fields import Base64ImageField
+from apps.recipe.ingredient_index import ingredient_index
 from apps.recipe.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
                                 ShoppingCart, Tag)
+from apps.recipe.reference import reference_data
+from apps.recipe.shopping_list import refresh_shopping_list
 from apps.accounts.models import Subscription
 
 User = get_user_model()
 
 
+class ImageVariantsField(serializers.Field):
+    """Ссылки на уменьшенные копии изображения по размерам и форматам."""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def url(self, path):
+        url = default_storage.url(path)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+    def to_representation(self, value):
+        return {
+            size: {
+                extension: self.url(path)
+                for extension, path in formats.items()
+            }
+            for size, formats in value.get('sizes', {}).items()
+        }
+
+
 class TokenCreateSerializer(serializers.Serializer):
     """Сериализатор создания токена."""
 
@@ -67,8 +95,11 @@ class CustomUserSerializer(serializers.ModelSerializer):
         method_name='get_is_followed',
     )
     avatar = Base64ImageField()
+    avatar_variants = ImageVariantsField()
 
     def get_is_followed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         return (
             request
@@ -79,7 +110,7 @@ class CustomUserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('email', 'id', 'username', 'first_name', 'last_name',
-                  'is_subscribed', 'avatar',)
+                  'is_subscribed', 'avatar', 'avatar_variants',)
 
 
 class UserAvatarSerializer(serializers.ModelSerializer):
@@ -163,8 +194,11 @@ class ReadRecipeSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     image = Base64ImageField()
+    image_variants = ImageVariantsField()
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         return (
             request
@@ -173,6 +207,8 @@ class ReadRecipeSerializer(serializers.ModelSerializer):
         )
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         return (
             request
@@ -181,30 +217,34 @@ class ReadRecipeSerializer(serializers.ModelSerializer):
             .filter(user=request.user).exists()
         )
 
+    def to_representation(self, instance):
+        if hasattr(instance, 'author_is_subscribed'):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        return super().to_representation(instance)
+
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
-                  'is_in_shopping_cart', 'name', 'image', 'text',
-                  'cooking_time', )
+                  'is_in_shopping_cart', 'name', 'image', 'image_variants',
+                  'text', 'cooking_time', )
 
 
 class ShortRecipeSerializer(serializers.ModelSerializer):
     """Короткий сериализатор рецепта."""
 
     image = Base64ImageField(required=True)
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
         read_only_fields = ('id', 'name', 'image', 'cooking_time')
 
 
 class CreateRecipeIngredientSerializer(serializers.ModelSerializer):
     """Сериализатор создания ингредиентов при создании рецепта."""
 
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all(),
-                                            source='ingredient',
-                                            required=True)
+    id = serializers.IntegerField(source='ingredient', required=True)
     amount = serializers.IntegerField(required=True,
                                       min_value=settings.MIN_AMOUNT)
 
@@ -218,8 +258,8 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
 
     ingredients = CreateRecipeIngredientSerializer(required=True, many=True)
     author = serializers.HiddenField(default=serializers.CurrentUserDefault())
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(), many=True, write_only=True, required=True)
+    tags = serializers.ListField(child=serializers.IntegerField(),
+                                 write_only=True, required=True)
     name = serializers.CharField(required=True,
                                  max_length=settings.MAX_LENTHG_RECIPE)
     cooking_time = serializers.IntegerField(min_value=settings.MIN_TIME,
@@ -248,19 +288,79 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
-        recipe = Recipe.objects.create(**validated_data)
-        self._create_ingredients(recipe, ingredients)
-        recipe.tags.set(tags)
+        with transaction.atomic():
+            recipe = Recipe.objects.create(**validated_data)
+            self._create_ingredients(recipe, ingredients)
+            recipe.tags.set(tags)
         return recipe
 
+    def _update_ingredients(self, recipe, ingredients_data):
+        """Изменение только отличающихся ингредиентов.
+
+        Возвращает id ингредиентов, которые добавлены, удалены
+        или сменили количество.
+        """
+        existing = {item.ingredient_id: item
+                    for item in recipe.recipe_ingredients.all()}
+        amounts = {item['ingredient'].id: item['amount']
+                   for item in ingredients_data}
+        removed = existing.keys() - amounts.keys()
+        added = [
+            RecipeIngredient(recipe=recipe, ingredient_id=ingredient_id,
+                             amount=amount)
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in existing
+        ]
+        changed = []
+        for ingredient_id, amount in amounts.items():
+            item = existing.get(ingredient_id)
+            if item is not None and item.amount != amount:
+                item.amount = amount
+                changed.append(item)
+        if removed:
+            recipe.recipe_ingredients.filter(
+                ingredient_id__in=removed).delete()
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ('amount',))
+        if added:
+            RecipeIngredient.objects.bulk_create(added)
+        return removed | {item.ingredient_id for item in changed + added}
+
+    def _update_tags(self, recipe, tags):
+        """Изменение только отличающихся тэгов."""
+        existing = {tag.id for tag in recipe.tags.all()}
+        new = {tag.id for tag in tags}
+        if existing - new:
+            recipe.tags.remove(*(existing - new))
+        if new - existing:
+            recipe.tags.add(*(new - existing))
+        return existing ^ new
+
     def update(self, instance, validated_data):
-        instance.recipe_ingredients.all().delete()
-        instance.tags.clear()
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
-        self._create_ingredients(instance, ingredients)
-        instance.tags.set(tags)
-        return super().update(instance, validated_data)
+        changed_fields = [
+            field for field, value in validated_data.items()
+            if field == 'image' or getattr(instance, field) != value
+        ]
+        with transaction.atomic():
+            changed_ingredients = self._update_ingredients(
+                instance, ingredients)
+            changed_tags = self._update_tags(instance, tags)
+            if changed_fields or changed_ingredients or changed_tags:
+                for field in changed_fields:
+                    setattr(instance, field, validated_data[field])
+                # post_save также сбрасывает кэши рецепта.
+                instance.save(update_fields=[*changed_fields, 'updated_at'])
+            if changed_ingredients:
+                ingredient_index.changed(instance.pk)
+                refresh_shopping_list(
+                    instance.in_shopping_cart.values_list(
+                        'user_id', flat=True),
+                    changed_ingredients)
+        if changed_ingredients or changed_tags:
+            instance._prefetched_objects_cache = {}
+        return instance
 
     def validate_image(self, value):
         if not self.instance and not value:
@@ -268,9 +368,7 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
                 'Изображение обязательно при создании.')
         return value
 
-    def _check_unique(self, items, field_name):
-        ids = [item.id if hasattr(item, 'id') else item.get('ingredient').id
-               for item in items]
+    def _check_unique(self, ids, field_name):
         if len(ids) != len(set(ids)):
             raise serializers.ValidationError(
                 {field_name:
@@ -285,14 +383,41 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
     def validate(self, attrs):
         self._check_required(attrs, 'tags')
         self._check_required(attrs, 'ingredients')
-        self._check_unique(attrs['tags'], 'tags')
-        self._check_unique(attrs['ingredients'], 'ingredients')
+        tag_ids = attrs['tags']
+        ingredient_ids = [item['ingredient'] for item in attrs['ingredients']]
+        self._check_unique(tag_ids, 'tags')
+        self._check_unique(ingredient_ids, 'ingredients')
+        tags = reference_data.resolve(Tag, tag_ids)
+        ingredients = reference_data.resolve(Ingredient, ingredient_ids)
+        errors = {}
+        for field_name, ids, found in (('tags', tag_ids, tags),
+                                       ('ingredients', ingredient_ids,
+                                        ingredients)):
+            missing = [str(pk) for pk in ids if pk not in found]
+            if missing:
+                errors[field_name] = f'Не найдены id: {", ".join(missing)}.'
+        if errors:
+            raise serializers.ValidationError(errors)
+        attrs['tags'] = [tags[pk] for pk in tag_ids]
+        for item in attrs['ingredients']:
+            item['ingredient'] = ingredients[item['ingredient']]
         return attrs
 
     def to_representation(self, instance):
+        prefetch_related_objects([instance], *Recipe.objects.related_lookups())
         return ReadRecipeSerializer(instance, context=self.context).data
 
 
+class ImportRecipeSerializer(CreateRecipeSerializer):
+    """Рецепт из файла импорта, автор задается при импорте."""
+
+    author = None
+
+    class Meta(CreateRecipeSerializer.Meta):
+        fields = ('tags', 'ingredients', 'name', 'image', 'text',
+                  'cooking_time')
+
+
 class FavoriteSerializer(serializers.ModelSerializer):
     """Сериализатор для избранных."""
 
@@ -326,9 +451,7 @@ class GetFollowSerializer(CustomUserSerializer):
     """Сериализатор получения подписок пользователя."""
 
     recipes = serializers.SerializerMethodField(method_name='get_recipe')
-    recipes_count = serializers.SerializerMethodField(
-        method_name='get_recipes_count',
-    )
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = User
@@ -338,6 +461,10 @@ class GetFollowSerializer(CustomUserSerializer):
         )
 
     def get_recipe(self, obj):
+        if hasattr(obj, 'limited_recipes'):
+            return ShortRecipeSerializer(
+                obj.limited_recipes, many=True, context=self.context
+            ).data
         request = self.context.get('request')
         recipes = obj.recipes.all()
         recipes_limit = request.GET.get('recipes_limit') if request else None
@@ -347,9 +474,6 @@ class GetFollowSerializer(CustomUserSerializer):
             recipes, many=True, context=self.context
         ).data
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
 
 class FollowSerializer(serializers.ModelSerializer):
     """Сериализатор создания/удаления подписок."""
@@ -0,0 +1,29 @@
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import token_cache
+
+User = get_user_model()
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token(instance, **kwargs):
+    # После удаления Collector обнуляет pk, то есть key: ключ берется сразу.
+    transaction.on_commit(partial(token_cache.invalidate, instance.key))
+
+
+@receiver((post_save, post_delete), sender=User)
+def invalidate_user_tokens(instance, created=False, update_fields=None,
+                           **kwargs):
+    """Сброс кэша токенов после изменения пароля, активности и профиля."""
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    keys = list(Token.objects.filter(user=instance).values_list(
+        'key', flat=True))
+    if keys:
+        transaction.on_commit(partial(token_cache.invalidate, *keys))
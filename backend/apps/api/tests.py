@@ -0,0 +1,1122 @@
+import base64
+import csv
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import (AsyncRequestFactory, RequestFactory, SimpleTestCase,
+                         TransactionTestCase, override_settings,
+                         skipUnlessDBFeature)
+from django.urls import resolve
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APITestCase
+
+from apps.accounts.models import Subscription
+from apps.api import async_views, views
+from apps.api.authentication import TokenCache, password_slots
+from apps.recipe.ingredient_index import ingredient_index
+from apps.recipe.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                                ShoppingCart, ShoppingListItem, Tag)
+from apps.recipe.reference import reference_data
+from apps.recipe.shopping_list import cart_totals, refresh_shopping_list
+from apps.recipe.short_links import encode_id
+from apps.recipe.versions import RECIPES_VERSION, get_versions
+from .fields import Base64ImageField, DecodedImageFile
+from .response_cache import (arecipe_detail_key, arecipe_list_key,
+                             recipe_list_key)
+
+User = get_user_model()
+
+
+def image_bytes(size=(10, 10), image_format='PNG'):
+    buffer = BytesIO()
+    Image.new('RGB', size).save(buffer, image_format)
+    return buffer.getvalue()
+
+
+class RecipeDataMixin:
+    """Тэги, ингредиенты, автор, читатель и рецепты автора."""
+
+    recipes_count = 8
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tags = [Tag.objects.create(name=f'Тэг {i}', slug=f'tag{i}')
+                    for i in range(3)]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(6)
+        ]
+        cls.author = User.objects.create_user(
+            email='author@example.com', username='author',
+            password='Pass12345!', first_name='Автор', last_name='Автор')
+        cls.reader = User.objects.create_user(
+            email='reader@example.com', username='reader',
+            password='Pass12345!', first_name='Читатель',
+            last_name='Читатель')
+        cls.recipes = [cls.create_recipe(number)
+                       for number in range(cls.recipes_count)]
+
+    @classmethod
+    def create_recipe(cls, number, author=None):
+        recipe = Recipe.objects.create(
+            author=author or cls.author, name=f'Рецепт {number}',
+            text='Описание', cooking_time=10,
+            image='recipes/images/test.png',
+            # Копии картинки в тестах не нужны.
+            image_variants={'source': 'recipes/images/test.png'})
+        recipe.tags.set(cls.tags[number % 3:number % 3 + 2])
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                             amount=number + 1)
+            for ingredient in cls.ingredients[number % 6:number % 6 + 3]
+        ])
+        return recipe
+
+    def setUp(self):
+        # Версии и кэши общие для всех тестов процесса.
+        cache.clear()
+        reference_data.get()
+
+
+class RecipeListQueriesTest(RecipeDataMixin, APITestCase):
+    """Число запросов списка рецептов не зависит от размера страницы."""
+
+    # Количество, страница id, тела рецептов, тэги, ингредиенты;
+    # пользователю еще флаги одним запросом.
+    ANONYMOUS_QUERIES = 5
+    AUTHENTICATED_QUERIES = 6
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Favorite.objects.create(user=cls.reader, recipe=cls.recipes[-1])
+        ShoppingCart.objects.create(user=cls.reader, recipe=cls.recipes[-2])
+        Subscription.objects.create(subscriber=cls.reader, target=cls.author)
+
+    def assert_list_queries(self, queries):
+        for limit in (2, 6):
+            with self.subTest(limit=limit):
+                cache.clear()
+                reference_data.get()
+                with self.assertNumQueries(queries):
+                    response = self.client.get(
+                        '/api/recipes/', {'limit': limit})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()['results']), limit)
+
+    def test_anonymous_list_queries(self):
+        self.assert_list_queries(self.ANONYMOUS_QUERIES)
+
+    def test_authenticated_list_queries(self):
+        self.client.force_authenticate(self.reader)
+        self.assert_list_queries(self.AUTHENTICATED_QUERIES)
+
+    def test_authenticated_flags(self):
+        self.client.force_authenticate(self.reader)
+        response = self.client.get('/api/recipes/', {'limit': 6})
+        flags = {
+            recipe['id']: (recipe['is_favorited'],
+                           recipe['is_in_shopping_cart'],
+                           recipe['author']['is_subscribed'])
+            for recipe in response.json()['results']
+        }
+        self.assertEqual(flags[self.recipes[-1].id], (True, False, True))
+        self.assertEqual(flags[self.recipes[-2].id], (False, True, True))
+        self.assertEqual(flags[self.recipes[-3].id], (False, False, True))
+
+
+class ShoppingListTest(RecipeDataMixin, APITestCase):
+    """Список покупок пересчитывается только по изменившимся позициям."""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.reader)
+
+    def shopping_list(self):
+        return {
+            (user_id, ingredient_id): total_amount
+            for user_id, ingredient_id, total_amount
+            in ShoppingListItem.objects.values_list(
+                'user', 'ingredient', 'total_amount')
+        }
+
+    def assert_shopping_list(self, expected):
+        self.assertEqual(self.shopping_list(), expected)
+        self.assertEqual(self.shopping_list(), {
+            (user_id, ingredient_id): total_amount
+            for user_id, ingredient_id, total_amount in cart_totals()
+        })
+
+    def add_to_cart(self, recipe):
+        response = self.client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        self.assertEqual(response.status_code, 201)
+
+    def test_add_and_remove_recipes(self):
+        # Рецепты 0 и 1 оба содержат ингредиенты 1 и 2.
+        self.add_to_cart(self.recipes[0])
+        self.add_to_cart(self.recipes[1])
+        reader, ingredients = self.reader.id, self.ingredients
+        self.assert_shopping_list({
+            (reader, ingredients[0].id): 1,
+            (reader, ingredients[1].id): 3,
+            (reader, ingredients[2].id): 3,
+            (reader, ingredients[3].id): 2,
+        })
+        response = self.client.delete(
+            f'/api/recipes/{self.recipes[0].id}/shopping_cart/')
+        self.assertEqual(response.status_code, 204)
+        self.assert_shopping_list({
+            (reader, ingredients[1].id): 2,
+            (reader, ingredients[2].id): 2,
+            (reader, ingredients[3].id): 2,
+        })
+
+    def test_recipe_update_changes_carts(self):
+        self.add_to_cart(self.recipes[0])
+        self.client.force_authenticate(self.author)
+        response = self.client.patch(
+            f'/api/recipes/{self.recipes[0].id}/', {
+                'name': 'Новое название', 'text': 'Описание',
+                'cooking_time': 10, 'tags': [self.tags[0].id],
+                'ingredients': [
+                    {'id': self.ingredients[0].id, 'amount': 5},
+                    {'id': self.ingredients[1].id, 'amount': 1},
+                    {'id': self.ingredients[5].id, 'amount': 7},
+                ],
+            }, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        reader, ingredients = self.reader.id, self.ingredients
+        self.assert_shopping_list({
+            (reader, ingredients[0].id): 5,
+            (reader, ingredients[1].id): 1,
+            (reader, ingredients[5].id): 7,
+        })
+
+    def test_recipe_delete_changes_carts(self):
+        self.add_to_cart(self.recipes[0])
+        self.add_to_cart(self.recipes[1])
+        self.client.force_authenticate(self.author)
+        response = self.client.delete(f'/api/recipes/{self.recipes[1].id}/')
+        self.assertEqual(response.status_code, 204)
+        reader, ingredients = self.reader.id, self.ingredients
+        self.assert_shopping_list({
+            (reader, ingredient.id): 1 for ingredient in ingredients[:3]
+        })
+
+    def test_rebuild_reports_and_fixes_drift(self):
+        self.add_to_cart(self.recipes[0])
+        ShoppingListItem.objects.filter(
+            ingredient=self.ingredients[0]).update(total_amount=100)
+        output = StringIO()
+        call_command('rebuild_shopping_lists', stdout=output)
+        self.assertIn('с неверным количеством: 1', output.getvalue())
+        self.assert_shopping_list({
+            (self.reader.id, ingredient.id): 1
+            for ingredient in self.ingredients[:3]
+        })
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ShoppingListConcurrencyTest(TransactionTestCase):
+    """Параллельные изменения корзины одного пользователя."""
+
+    def test_parallel_cart_changes(self):
+        author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Автор', last_name='Автор')
+        reader = User.objects.create_user(
+            email='reader@example.com', username='reader',
+            first_name='Читатель', last_name='Читатель')
+        flour, salt = Ingredient.objects.bulk_create([
+            Ingredient(name='мука', measurement_unit='г'),
+            Ingredient(name='соль', measurement_unit='г')])
+        recipes = Recipe.objects.bulk_create([
+            Recipe(author=author, name=f'Рецепт {number}', text='Описание',
+                   cooking_time=10, image='recipes/images/test.png')
+            for number in range(8)])
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for recipe in recipes for ingredient in (flour, salt)])
+        barrier = Barrier(len(recipes))
+
+        def add_to_cart(recipe):
+            try:
+                barrier.wait()
+                with transaction.atomic():
+                    ShoppingCart.objects.create(user=reader, recipe=recipe)
+                    refresh_shopping_list([reader.id], [flour.id, salt.id])
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(len(recipes)) as executor:
+            list(executor.map(add_to_cart, recipes))
+        self.assertEqual(
+            dict(ShoppingListItem.objects.filter(user=reader).values_list(
+                'ingredient', 'total_amount')),
+            {flour.id: len(recipes), salt.id: len(recipes)})
+
+
+class ShoppingListDownloadTest(RecipeDataMixin, APITestCase):
+    """Потоковая выгрузка списка покупок в txt, csv и json."""
+
+    url = '/api/recipes/download_shopping_cart/'
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.reader)
+
+    def fill_cart(self):
+        for recipe in self.recipes[:2]:
+            ShoppingCart.objects.create(user=self.reader, recipe=recipe)
+        refresh_shopping_list(
+            [self.reader.id], [ingredient.id for ingredient
+                               in self.ingredients])
+        Ingredient.objects.filter(pk=self.ingredients[3].pk).update(
+            measurement_unit='шт')
+
+    def download(self, expected_format, **params):
+        response = self.client.get(self.url, **params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith(
+            {'txt': 'text/plain', 'csv': 'text/csv',
+             'json': 'application/json'}[expected_format]))
+        self.assertEqual(
+            response['Content-Disposition'],
+            f'attachment; filename="shopping_list.{expected_format}"')
+        return b''.join(response.streaming_content).decode()
+
+    def test_formats(self):
+        self.fill_cart()
+        names = [ingredient.name for ingredient in self.ingredients]
+        self.assertEqual(self.download('txt'), (
+            f'[г]\n1. {names[0]} - 1 г.\n2. {names[1]} - 3 г.\n'
+            f'3. {names[2]} - 3 г.\n\n[шт]\n4. {names[3]} - 2 шт.\n'))
+        self.assertEqual(
+            list(csv.reader(self.download('csv', data={'format': 'csv'})
+                            .splitlines())),
+            [['measurement_unit', 'name', 'amount'], ['г', names[0], '1'],
+             ['г', names[1], '3'], ['г', names[2], '3'],
+             ['шт', names[3], '2']])
+        self.assertEqual(
+            json.loads(self.download('json', data={'format': 'json'})), {
+                'г': [{'name': names[0], 'amount': 1},
+                      {'name': names[1], 'amount': 3},
+                      {'name': names[2], 'amount': 3}],
+                'шт': [{'name': names[3], 'amount': 2}],
+            })
+
+    def test_empty_cart(self):
+        self.assertEqual(self.download('txt'), '')
+        self.assertEqual(self.download('csv', data={'format': 'csv'}),
+                         'measurement_unit,name,amount\r\n')
+        self.assertEqual(
+            json.loads(self.download('json', data={'format': 'json'})), {})
+
+    def test_accept_header(self):
+        self.assertEqual(self.download('csv', HTTP_ACCEPT='text/csv'),
+                         'measurement_unit,name,amount\r\n')
+        self.assertEqual(
+            self.download('json', HTTP_ACCEPT='application/json'), '{}')
+        self.assertEqual(self.download('txt', HTTP_ACCEPT='*/*'), '')
+        response = self.client.get(self.url, HTTP_ACCEPT='application/xml')
+        self.assertEqual(response.status_code, 406)
+
+    def test_anonymous(self):
+        self.client.force_authenticate(None)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 401)
+
+
+class CursorPaginationTest(RecipeDataMixin, APITestCase):
+    """Курсорная пагинация ленты рецептов и подписок."""
+
+    def walk(self, url, params):
+        """Все страницы по ссылкам next, затем обратно по previous."""
+        response = self.client.get(url, {**params, 'cursor': ''})
+        self.assertEqual(response.status_code, 200, response.content)
+        pages = [response.json()]
+        while pages[-1]['next']:
+            pages.append(self.client.get(pages[-1]['next']).json())
+        backward = [pages[-1]]
+        while backward[-1]['previous']:
+            backward.append(self.client.get(backward[-1]['previous']).json())
+        return pages, backward[::-1]
+
+    def ids(self, pages):
+        return [item['id'] for page in pages for item in page['results']]
+
+    def test_recipe_pages_match_page_mode(self):
+        expected = [recipe.id for recipe in self.recipes[::-1]]
+        pages, backward = self.walk('/api/recipes/', {'limit': 3})
+        self.assertEqual(self.ids(pages), expected)
+        self.assertEqual(self.ids(backward), expected)
+        self.assertEqual([len(page['results']) for page in pages],
+                         [3, 3, 2])
+        self.assertTrue(all(page['count'] == len(expected)
+                            for page in pages))
+        page_mode = self.client.get('/api/recipes/', {'limit': 6}).json()
+        self.assertEqual(self.ids([page_mode]), expected[:6])
+
+    def test_cursor_with_filter(self):
+        tag = self.tags[0]
+        expected = [recipe.id for recipe in self.recipes[::-1]
+                    if tag in recipe.tags.all()]
+        pages, _ = self.walk('/api/recipes/', {'limit': 2,
+                                               'tags': tag.slug})
+        self.assertEqual(self.ids(pages), expected)
+
+    def test_default_ordering_is_allowed(self):
+        response = self.client.get(
+            '/api/recipes/', {'cursor': '', 'ordering': '-created_at'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_other_ordering_is_rejected(self):
+        response = self.client.get(
+            '/api/recipes/', {'cursor': '', 'ordering': '-favorites_count'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ordering', response.json())
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/recipes/', {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_subscription_pages(self):
+        authors = [
+            User.objects.create_user(
+                email=f'{name}@example.com', username=name,
+                first_name=name, last_name=name)
+            for name in ('carol', 'alice', 'bob')
+        ]
+        for author in authors:
+            Subscription.objects.create(subscriber=self.reader, target=author)
+        self.client.force_authenticate(self.reader)
+        pages, backward = self.walk('/api/users/subscriptions/',
+                                    {'limit': 2})
+        usernames = [item['username'] for page in pages
+                     for item in page['results']]
+        self.assertEqual(usernames, ['alice', 'bob', 'carol'])
+        self.assertEqual(self.ids(backward), self.ids(pages))
+
+
+class RecipesByIngredientsTest(RecipeDataMixin, APITestCase):
+    """Подбор рецептов по имеющимся ингредиентам."""
+
+    URL = '/api/recipes/by_ingredients/'
+
+    def setUp(self):
+        super().setUp()
+        ingredient_index._state = None
+        self.addCleanup(setattr, ingredient_index, '_state', None)
+
+    def get(self, **params):
+        return self.client.get(self.URL, params)
+
+    def test_coverage_order(self):
+        # У рецептов 4 и 5 есть все ингредиенты, у 3 две трети, у 2 треть;
+        # при равной доле выше рецепт с большим числом совпадений.
+        ids = f'{self.ingredients[4].id},{self.ingredients[5].id}'
+        response = self.get(ingredients=ids)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 4)
+        self.assertEqual(
+            [(item['id'], item['coverage'])
+             for item in response.data['results']],
+            [(self.recipes[4].id, 1.0), (self.recipes[5].id, 1.0),
+             (self.recipes[3].id, 0.667), (self.recipes[2].id, 0.333)])
+
+    def test_pagination(self):
+        ids = [self.ingredients[4].id, self.ingredients[5].id]
+        first = self.get(ingredients=ids, limit=3)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.data['count'], 4)
+        self.assertIsNotNone(first.data['next'])
+        self.assertEqual([item['id'] for item in first.data['results']],
+                         [self.recipes[4].id, self.recipes[5].id,
+                          self.recipes[3].id])
+        second = self.get(ingredients=ids, limit=3, page=2)
+        self.assertIsNone(second.data['next'])
+        self.assertEqual([item['id'] for item in second.data['results']],
+                         [self.recipes[2].id])
+
+    def test_invalid_ingredients(self):
+        for params in ({}, {'ingredients': ''}, {'ingredients': 'abc'},
+                       {'ingredients': '1,-2'},
+                       {'ingredients': ','.join(map(str, range(
+                           1, settings.MAX_SEARCH_INGREDIENTS + 2)))}):
+            with self.subTest(params=params):
+                response = self.get(**params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('ingredients', response.data)
+
+
+class ResponseCacheInvalidationTest(RecipeDataMixin, APITestCase):
+    """Изменение пользователя сбрасывает только кэши его рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other_author = User.objects.create_user(
+            email='other@example.com', username='other',
+            first_name='Другой', last_name='Автор')
+        cls.other_recipe = cls.create_recipe(0, author=cls.other_author)
+
+    def feed_version(self):
+        return get_versions(RECIPES_VERSION)[RECIPES_VERSION]
+
+    def detail(self, recipe):
+        response = self.client.get(f'/api/recipes/{recipe.id}/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_signup_keeps_caches(self):
+        key = recipe_list_key(RequestFactory().get('/api/recipes/'))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/users/', {
+                'email': 'new@example.com', 'username': 'new',
+                'first_name': 'Новый', 'last_name': 'Пользователь',
+                'password': 'Pass12345!'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            recipe_list_key(RequestFactory().get('/api/recipes/')), key)
+
+    def test_reader_change_keeps_feed(self):
+        version = self.feed_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reader.first_name = 'Иван'
+            self.reader.save()
+        self.assertEqual(self.feed_version(), version)
+
+    def test_author_change_refreshes_only_his_recipes(self):
+        self.detail(self.recipes[0])
+        self.detail(self.other_recipe)
+        version = self.feed_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.first_name = 'Иван'
+            self.author.save()
+        self.assertNotEqual(self.feed_version(), version)
+        self.assertEqual(
+            self.detail(self.recipes[0])['author']['first_name'], 'Иван')
+        self.client.get('/api/recipes/')
+        with self.assertNumQueries(0):
+            self.detail(self.other_recipe)
+        results = {recipe['id']: recipe for recipe in self.client.get(
+            '/api/recipes/').json()['results']}
+        self.assertEqual(
+            results[self.recipes[-1].id]['author']['first_name'], 'Иван')
+        self.assertEqual(
+            results[self.other_recipe.id]['author']['first_name'], 'Другой')
+
+
+class ConditionalResponseTest(RecipeDataMixin, APITestCase):
+    """ETag кэшированных ответов и его смена после изменения данных."""
+
+    def assert_etag_changes(self, url, change):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(response.content)
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        return response.json()
+
+    def rename_recipe(self):
+        recipe = self.recipes[-1]
+        self.client.force_authenticate(self.author)
+        response = self.client.patch(f'/api/recipes/{recipe.id}/', {
+            'name': 'Новое название', 'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+            'tags': [tag.id for tag in recipe.tags.all()],
+            'ingredients': [
+                {'id': item.ingredient_id, 'amount': item.amount}
+                for item in recipe.recipe_ingredients.all()],
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.client.force_authenticate(None)
+
+    def test_recipe_detail(self):
+        data = self.assert_etag_changes(
+            f'/api/recipes/{self.recipes[-1].id}/', self.rename_recipe)
+        self.assertEqual(data['name'], 'Новое название')
+
+    def test_recipe_list(self):
+        data = self.assert_etag_changes('/api/recipes/', self.rename_recipe)
+        self.assertEqual(data['results'][0]['name'], 'Новое название')
+
+    def test_tags(self):
+        data = self.assert_etag_changes(
+            '/api/tags/',
+            lambda: Tag.objects.create(name='Новый', slug='new'))
+        self.assertIn('new', [tag['slug'] for tag in data])
+
+
+class AsyncViewsTest(RecipeDataMixin, APITestCase):
+    """Асинхронные представления режима ASGI."""
+
+    factory = AsyncRequestFactory()
+
+    async def call(self, view, request, **kwargs):
+        response = await view(request, **kwargs)
+        if hasattr(response, 'render'):
+            # Ответы DRF рендерит обработчик Django, здесь его нет.
+            response.render()
+        return response
+
+    async def assert_miss_then_hit(self, view, fallback, key, path,
+                                   **kwargs):
+        """Промах заполняет кэш через DRF, попадание обходится без него."""
+        self.assertIsNone(await cache.aget(key))
+        response = await self.call(view, self.factory.get(path), **kwargs)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(await cache.aget(key))
+        with mock.patch.object(async_views, fallback,
+                               side_effect=AssertionError(fallback)):
+            cached = await self.call(view, self.factory.get(path), **kwargs)
+        self.assertEqual(cached.status_code, 200)
+        self.assertEqual(cached['ETag'], response['ETag'])
+        self.assertEqual(json.loads(cached.content),
+                         json.loads(response.content))
+        not_modified = await self.call(view, self.factory.get(
+            path, headers={'If-None-Match': response['ETag']}), **kwargs)
+        self.assertEqual(not_modified.status_code, 304)
+        return json.loads(cached.content)
+
+    async def test_recipe_list(self):
+        data = await self.assert_miss_then_hit(
+            async_views.recipe_list, 'sync_recipe_list',
+            await arecipe_list_key(self.factory.get('/api/recipes/')),
+            '/api/recipes/')
+        self.assertEqual(data['count'], self.recipes_count)
+        self.assertEqual(data['results'][0]['id'], self.recipes[-1].id)
+
+    async def test_recipe_detail(self):
+        recipe = self.recipes[0]
+        data = await self.assert_miss_then_hit(
+            async_views.recipe_detail, 'sync_recipe_detail',
+            await arecipe_detail_key(recipe.id),
+            f'/api/recipes/{recipe.id}/', pk=recipe.id)
+        self.assertEqual(data['name'], recipe.name)
+
+    async def test_authenticated_goes_to_drf(self):
+        path = '/api/recipes/'
+        await self.call(async_views.recipe_list, self.factory.get(path))
+        token = await Token.objects.acreate(user=self.reader)
+        with mock.patch.object(async_views, 'sync_recipe_list',
+                               wraps=async_views.sync_recipe_list) as drf:
+            response = await self.call(async_views.recipe_list,
+                                       self.factory.get(path, headers={
+                                           'Authorization':
+                                               f'Token {token.key}'}))
+        self.assertEqual(response.status_code, 200)
+        drf.assert_called_once()
+
+    async def test_missing_recipe(self):
+        for _ in range(2):
+            response = await self.call(
+                async_views.recipe_detail,
+                self.factory.get('/api/recipes/999999/'), pk=999999)
+            self.assertEqual(response.status_code, 404)
+
+    async def test_anonymous_writes(self):
+        recipe = self.recipes[0]
+        cases = (
+            (async_views.recipe_list,
+             self.factory.post('/api/recipes/', {}), {}),
+            (async_views.recipe_detail,
+             self.factory.patch(f'/api/recipes/{recipe.id}/', {}),
+             {'pk': recipe.id}),
+            (async_views.recipe_detail,
+             self.factory.delete(f'/api/recipes/{recipe.id}/'),
+             {'pk': recipe.id}),
+        )
+        for view, request, kwargs in cases:
+            with self.subTest(method=request.method):
+                response = await self.call(view, request, **kwargs)
+                self.assertEqual(response.status_code, 401)
+
+    async def test_tags(self):
+        response = await self.call(async_views.tag_list,
+                                   self.factory.get('/api/tags/'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([tag['slug'] for tag in json.loads(response.content)],
+                         [tag.slug for tag in self.tags])
+
+    async def test_short_link(self):
+        recipe = self.recipes[0]
+        response = await async_views.redirect_to_recipe(
+            self.factory.get('/s/'), code=encode_id(recipe.id))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], f'/recipes/{recipe.id}/')
+        response = await async_views.redirect_to_recipe(
+            self.factory.get('/s/'), code=encode_id(999999))
+        self.assertEqual(response.status_code, 400)
+        response = await async_views.redirect_to_recipe(
+            self.factory.post('/s/'), code=encode_id(recipe.id))
+        self.assertEqual(response.status_code, 405)
+
+
+class WsgiRoutesTest(SimpleTestCase):
+    """Под WSGI запросы обслуживают синхронные вьюсеты."""
+
+    def test_router_views(self):
+        self.assertIs(resolve('/api/recipes/').func.cls, views.RecipesViewSet)
+        self.assertIs(resolve('/api/recipes/1/').func.cls,
+                      views.RecipesViewSet)
+        self.assertIs(resolve('/api/tags/').func.cls, views.TagView)
+
+    def test_short_link_view(self):
+        self.assertIs(resolve('/s/b/').func.cls,
+                      views.redirect_to_recipe.cls)
+
+
+class TokenCacheTest(SimpleTestCase):
+    """Счетчики кэша токенов."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_counters_from_threads(self):
+        tokens = TokenCache(size=10, timeout=60)
+        version = tokens.version()
+        with ThreadPoolExecutor(8) as executor:
+            list(executor.map(lambda _: tokens.get('missing', version),
+                              range(400)))
+        tokens.set('known', {'id': 1}, version)
+        tokens.get('known', version)
+        self.assertEqual(tokens.stats, {'misses': 400, 'local_hits': 1})
+
+    def test_counters_are_logged(self):
+        tokens = TokenCache(size=10, timeout=60, stats_every=2)
+        version = tokens.version()
+        with self.assertLogs('apps.api.authentication', 'INFO') as logs:
+            tokens.get('missing', version)
+            tokens.get('missing', version)
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('промахов 2', logs.output[0])
+
+
+class TokenInvalidationTest(APITestCase):
+    """Отозванный токен перестает работать сразу, несмотря на кэш."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='user@example.com', username='user', password='Pass12345!',
+            first_name='Имя', last_name='Фамилия')
+        self.login()
+
+    def login(self):
+        self.client.credentials()
+        response = self.client.post('/api/auth/token/login/', {
+            'email': 'user@example.com', 'password': 'Pass12345!'})
+        self.assertEqual(response.status_code, 200)
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {response.json()["auth_token"]}')
+        # Второй запрос уже берет пользователя из кэша токенов.
+        for _ in range(2):
+            self.assertEqual(self.me().status_code, 200)
+
+    def me(self):
+        return self.client.get('/api/users/me/')
+
+    def test_logout(self):
+        for method in ('post', 'delete'):
+            with self.subTest(method=method):
+                self.login()
+                with self.captureOnCommitCallbacks(execute=True):
+                    response = getattr(self.client, method)(
+                        '/api/auth/token/logout/')
+                self.assertEqual(response.status_code, 204)
+                self.assertEqual(self.me().status_code, 401)
+
+    def test_deactivation(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.me().status_code, 401)
+
+    def test_token_deleted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Token.objects.filter(user=self.user).delete()
+        self.assertEqual(self.me().status_code, 401)
+
+
+class LoginTest(APITestCase):
+    """Вход с ограниченным числом одновременных проверок пароля."""
+
+    url = '/api/auth/token/login/'
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='user@example.com', username='user', password='Pass12345!',
+            first_name='Имя', last_name='Фамилия')
+
+    def login(self, email='user@example.com', password='Pass12345!'):
+        return self.client.post(self.url,
+                                {'email': email, 'password': password})
+
+    def test_success(self):
+        response = self.login()
+        self.assertEqual(response.status_code, 200)
+        key = response.json()['auth_token']
+        self.assertEqual(Token.objects.get(user=self.user).key, key)
+        # Пользователь и токен одним запросом.
+        with self.assertNumQueries(1):
+            response = self.login()
+        self.assertEqual(response.json(), {'auth_token': key})
+
+    def test_invalid_credentials(self):
+        cases = (
+            ({'password': 'wrong'}, 'Неверные учетные данные'),
+            ({'email': 'nobody@example.com'},
+             'Пользователь с таким email не найден'),
+        )
+        for credentials, error in cases:
+            with self.subTest(credentials=credentials):
+                response = self.login(**credentials)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'error': error})
+        self.assertFalse(Token.objects.exists())
+
+    def test_inactive_user(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        response = self.login()
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Token.objects.exists())
+
+    @override_settings(LOGIN_HASH_TIMEOUT=0.01)
+    def test_all_slots_busy(self):
+        taken = 0
+        while password_slots.acquire(blocking=False):
+            taken += 1
+        try:
+            response = self.login()
+        finally:
+            for _ in range(taken):
+                password_slots.release()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(self.login().status_code, 200)
+
+
+class Base64ImageFieldTest(SimpleTestCase):
+    """Проверка картинок строкой base64 и файлом."""
+
+    def validate(self, data):
+        return Base64ImageField().run_validation(data)
+
+    def assert_error(self, data, code):
+        with self.assertRaises(ValidationError) as context:
+            self.validate(data)
+        self.assertEqual(context.exception.get_codes(), [code])
+
+    def test_data_uri(self):
+        content = image_bytes()
+        file = self.validate('data:image/png;base64,'
+                             + base64.b64encode(content).decode())
+        self.assertIsInstance(file, DecodedImageFile)
+        self.assertTrue(file.name.endswith('.png'))
+        self.assertEqual(file.size, len(content))
+        self.assertEqual(file.read(), content)
+        file.close()
+        self.assertFalse(os.path.exists(file.file.name))
+
+    @override_settings(IMAGE_UPLOAD_CHUNK_SIZE=7)
+    def test_plain_base64_with_line_breaks(self):
+        content = image_bytes(image_format='JPEG')
+        encoded = base64.encodebytes(content).decode()
+        file = self.validate(encoded)
+        self.assertTrue(file.name.endswith('.jpg'))
+        self.assertEqual(file.read(), content)
+
+    def test_invalid_base64(self):
+        encoded = base64.b64encode(image_bytes()).decode()
+        for data in ('data:image/png;base64,' + encoded[:-1] + '!',
+                     encoded[:-3], 'data:image/png,' + encoded):
+            with self.subTest(data=data[-10:]):
+                self.assert_error(data, 'invalid_base64')
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=100)
+    def test_size_is_checked_before_decoding(self):
+        # Заведомо некорректный base64 не декодируется.
+        self.assert_error('data:image/png;base64,' + '!' * 200,
+                          'too_large')
+        self.assert_error(SimpleUploadedFile('big.png', b'0' * 200),
+                          'too_large')
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIDE=5)
+    def test_image_sides(self):
+        self.assert_error(base64.b64encode(image_bytes()).decode(),
+                          'too_big')
+
+    def test_not_an_image(self):
+        self.assert_error(base64.b64encode(b'not an image').decode(),
+                          'invalid_image')
+
+    def test_unsupported_format(self):
+        self.assert_error(
+            base64.b64encode(image_bytes(image_format='BMP')).decode(),
+            'invalid_format')
+
+    def test_multipart_file(self):
+        content = image_bytes()
+        file = self.validate(SimpleUploadedFile('dish.png', content))
+        self.assertEqual(file.read(), content)
+
+
+class RecipeUpdateTest(RecipeDataMixin, APITestCase):
+    """Изменение рецепта записывает только отличающиеся данные."""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.author)
+        self.recipe = self.recipes[0]
+
+    def update(self, **changes):
+        data = {
+            'name': self.recipe.name, 'text': self.recipe.text,
+            'cooking_time': self.recipe.cooking_time,
+            'tags': [tag.id for tag in self.recipe.tags.all()],
+            'ingredients': [
+                {'id': item.ingredient_id, 'amount': item.amount}
+                for item in self.recipe.recipe_ingredients.all()
+            ],
+            **changes,
+        }
+        response = self.client.patch(f'/api/recipes/{self.recipe.id}/',
+                                     data, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def assert_updated_at(self, changed, **changes):
+        before = Recipe.objects.get(pk=self.recipe.pk).updated_at
+        self.update(**changes)
+        after = Recipe.objects.get(pk=self.recipe.pk).updated_at
+        self.assertEqual(after > before, changed)
+
+    def test_updated_at(self):
+        cases = (
+            (False, {}),
+            (True, {'name': 'Новое название'}),
+            (True, {'tags': [self.tags[2].id]}),
+            (True, {'ingredients': [
+                {'id': self.ingredients[5].id, 'amount': 3}]}),
+        )
+        for changed, changes in cases:
+            with self.subTest(changes=changes):
+                self.assert_updated_at(changed, **changes)
+
+    def test_rows_are_diffed(self):
+        kept = self.recipe.recipe_ingredients.get(
+            ingredient=self.ingredients[0])
+        data = self.update(ingredients=[
+            {'id': self.ingredients[0].id, 'amount': 1},
+            {'id': self.ingredients[1].id, 'amount': 9},
+            {'id': self.ingredients[4].id, 'amount': 4},
+        ])
+        self.assertEqual(
+            {(item['id'], item['amount']) for item in data['ingredients']},
+            {(self.ingredients[0].id, 1), (self.ingredients[1].id, 9),
+             (self.ingredients[4].id, 4)})
+        self.assertTrue(RecipeIngredient.objects.filter(pk=kept.pk).exists())
+
+
+class RecipeReferenceValidationTest(RecipeDataMixin, APITestCase):
+    """Неизвестные id тэгов и ингредиентов перечисляются в ошибке."""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(MEDIA_ROOT=directory.name,
+                                  IMAGE_VARIANTS_ASYNC=False)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.client.force_authenticate(self.author)
+
+    def payload(self, tags, ingredients):
+        return {
+            'name': 'Рецепт', 'text': 'Описание', 'cooking_time': 10,
+            'tags': tags,
+            'ingredients': [{'id': pk, 'amount': 1} for pk in ingredients],
+            'image': 'data:image/png;base64,'
+                     + base64.b64encode(image_bytes()).decode(),
+        }
+
+    def test_unknown_ids_are_listed(self):
+        count = Recipe.objects.count()
+        response = self.client.post('/api/recipes/', self.payload(
+            [self.tags[0].id, 998, 999],
+            [997, self.ingredients[0].id]), format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {
+            'tags': ['Не найдены id: 998, 999.'],
+            'ingredients': ['Не найдены id: 997.'],
+        })
+        self.assertEqual(Recipe.objects.count(), count)
+
+    def test_only_ingredients_unknown(self):
+        recipe = self.recipes[0]
+        response = self.client.patch(
+            f'/api/recipes/{recipe.id}/',
+            self.payload([self.tags[0].id], [996]), format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(),
+                         {'ingredients': ['Не найдены id: 996.']})
+
+    def test_ids_missing_from_snapshot(self):
+        # bulk_create не отправляет сигналы: снимок справочников устарел.
+        tag, = Tag.objects.bulk_create([Tag(name='Новый', slug='new')])
+        ingredient, = Ingredient.objects.bulk_create(
+            [Ingredient(name='Новый', measurement_unit='г')])
+        response = self.client.post('/api/recipes/', self.payload(
+            [tag.id], [ingredient.id]), format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual([item['id'] for item in response.json()['tags']],
+                         [tag.id])
+
+
+class ExportImportTest(APITestCase):
+    """Выгрузку рецептов можно загрузить обратно."""
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name)
+        settings = override_settings(MEDIA_ROOT=self.path / 'media')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.admin = User.objects.create_user(
+            email='admin@example.com', username='admin',
+            first_name='Админ', last_name='Админ', is_staff=True)
+        tags = [Tag.objects.create(name=f'Тэг {i}', slug=f'tag{i}')
+                for i in range(2)]
+        ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(3)
+        ]
+        self.client.force_authenticate(self.admin)
+        for number in range(2):
+            response = self.client.post('/api/recipes/', {
+                'name': f'Рецепт {number}', 'text': 'Описание',
+                'cooking_time': 5 + number,
+                'image': 'data:image/png;base64,' + base64.b64encode(
+                    image_bytes((10 + number, 10))).decode(),
+                'tags': [tags[number].id],
+                'ingredients': [
+                    {'id': ingredients[number].id, 'amount': 10},
+                    {'id': ingredients[2].id, 'amount': 20 + number},
+                ],
+            }, format='json')
+            self.assertEqual(response.status_code, 201, response.content)
+        self.originals = list(Recipe.objects.order_by('id'))
+
+    def snapshot(self, recipe):
+        with recipe.image.open('rb') as image:
+            content = image.read()
+        return (recipe.name, recipe.text, recipe.cooking_time, content,
+                sorted(recipe.tags.values_list('id', flat=True)),
+                sorted(recipe.recipe_ingredients.values_list(
+                    'ingredient_id', 'amount')))
+
+    def copies(self):
+        return list(Recipe.objects.exclude(
+            id__in=[recipe.id for recipe in self.originals]).order_by('id'))
+
+    def test_api_round_trip(self):
+        response = self.client.get('/api/recipes/export/')
+        self.assertEqual(response.status_code, 200)
+        export = b''.join(response.streaming_content)
+        response = self.client.post('/api/recipes/import/', {
+            'file': SimpleUploadedFile('recipes.ndjson', export)})
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['created'], 2)
+        self.assertEqual(response.json()['errors'], [])
+        copies = self.copies()
+        self.assertEqual([self.snapshot(recipe) for recipe in copies],
+                         [self.snapshot(recipe) for recipe in self.originals])
+        self.assertTrue(all(
+            copy.image.name != original.image.name
+            for copy, original in zip(copies, self.originals)))
+
+    def test_command_round_trip_with_images(self):
+        archive = self.path / 'recipes.zip'
+        call_command('export_recipes', with_images=True, output=archive,
+                     stderr=StringIO())
+        expected = [self.snapshot(recipe) for recipe in self.originals]
+        # Картинки должны браться из архива, а не из хранилища.
+        for recipe in self.originals:
+            default_storage.delete(recipe.image.name)
+        call_command('import_recipes', archive, author=self.admin.email,
+                     stdout=StringIO(), stderr=StringIO())
+        self.assertEqual([self.snapshot(recipe) for recipe in self.copies()],
+                         expected)
+
+
+class IngredientAutocompleteTest(APITestCase):
+    """Подсказки ингредиентов: сначала совпадения по началу названия."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create([
+            Ingredient(name=name, measurement_unit='г') for name in (
+                'морская соль', 'соль', 'сода', 'соль поваренная',
+                'кислота', *(f'соус {number}' for number in range(12)))
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def names(self, **params):
+        response = self.client.get('/api/ingredients/autocomplete/', params)
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.json()]
+
+    def check_ranking(self):
+        self.assertEqual(self.names(name='соль'),
+                         ['соль', 'соль поваренная', 'морская соль'])
+        self.assertEqual(self.names(name='соль', limit=2),
+                         ['соль', 'соль поваренная'])
+        self.assertEqual(self.names(name='ота'), ['кислота'])
+        self.assertEqual(self.names(name='нет такого'), [])
+
+    def check_limit(self):
+        self.assertEqual(len(self.names(name='со')), 10)
+        self.assertEqual(len(self.names(name='со', limit=100)), 10)
+        self.assertEqual(len(self.names(name='со', limit='abc')), 10)
+
+    def test_prefix_index(self):
+        with mock.patch('apps.recipe.search._uses_prefix_index',
+                        return_value=True):
+            self.check_ranking()
+            self.check_limit()
+            self.assertEqual(self.names(name='СОЛЬ П'), ['соль поваренная'])
+
+    def test_database_ranking(self):
+        with mock.patch('apps.recipe.search._uses_prefix_index',
+                        return_value=False):
+            self.check_ranking()
+            self.check_limit()
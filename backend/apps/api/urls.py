@@ -1,6 +1,9 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework import routers
 
+from .async_views import (ingredient_autocomplete, recipe_detail,
+                          recipe_list, tag_list)
 from .views import (IngredientView, RecipesViewSet, TagView,
                     CustomTokenCreateView, CustomTokenDestroyView,
                     CustomUserViewSet)
@@ -19,3 +22,14 @@ urlpatterns = [
          name='token_delete'),
     path('users/', include('djoser.urls')),
 ]
+
+if settings.ASGI_MODE:
+    # Асинхронные обработчики частых запросов на чтение, остальные
+    # запросы они передают вьюсетам из router. Под WSGI каждый из них
+    # работал бы через async_to_sync, поэтому там они не подключаются.
+    urlpatterns = [
+        path('tags/', tag_list),
+        path('ingredients/autocomplete/', ingredient_autocomplete),
+        path('recipes/', recipe_list),
+        path('recipes/<int:pk>/', recipe_detail),
+    ] + urlpatterns
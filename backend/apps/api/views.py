@@ -1,20 +1,29 @@
+import zipfile
+from functools import partial
+
 from django.conf import settings
-from django.core.exceptions import ValidationError
-from django.contrib.auth import authenticate, get_user_model
-from django.db.models import Sum
-from django.core.exceptions import ObjectDoesNotExist
-from django.http import HttpResponse
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.db import transaction
+from django.db.models import F, Prefetch, Value
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect
+from django.utils.cache import patch_cache_control
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import TokenCreateView, TokenDestroyView, UserViewSet
 from rest_framework import status, viewsets
 from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.filters import SearchFilter
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
 
-from .filters import IngredientFilter, RecipeFilter
+from .authentication import check_password_bounded
+from .bulk import RecipeImporter, export_recipes, open_recipe_rows
+from .filters import IngredientFilter, RecipeFilter, RecipeOrderingFilter
 from .serializers import (
     CreateRecipeSerializer, FavoriteSerializer, IngredientSerializer,
     ReadRecipeSerializer, ShoppingCartSerializer, ShortRecipeSerializer,
@@ -22,15 +31,76 @@ from .serializers import (
     CustomUserSerializer, FollowSerializer, GetFollowSerializer,
     UserAvatarSerializer)
 from apps.recipe.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                                ShoppingCart, Tag)
+                                ShoppingCart, ShoppingListItem, Tag)
+from apps.recipe.ingredient_index import ingredient_index
+from apps.recipe.reference import reference_data
+from apps.recipe.search import autocomplete_ingredients
+from apps.recipe.shopping_list import refresh_shopping_list
+from apps.recipe.short_links import decode_code, encode_id, live_recipes
 from apps.accounts.models import Subscription
-from .pagination import Pagination
+from .pagination import Pagination, RecipePagination, SubscriptionPagination
 from .permissions import IsOwnerOrReadOnly
+from .response_cache import (author_dependencies, cached_json_response,
+                             get_recipe_bodies, json_response, make_etag,
+                             recipe_detail_key, recipe_list_key)
+from .renderers import (CSVShoppingListRenderer, JSONShoppingListRenderer,
+                        TextShoppingListRenderer)
 
 User = get_user_model()
 
 
-class TagView(viewsets.ModelViewSet):
+def reference_list_payload(snapshot, serializer_class, items):
+    """Готовый JSON справочника и его ETag, один раз на версию."""
+
+    def render(snapshot):
+        payload = JSONRenderer().render(
+            serializer_class(getattr(snapshot, items), many=True).data)
+        return payload, make_etag(payload)
+
+    return snapshot.memo(f'{items}_json', render)
+
+
+def reference_list_response(request, serializer_class, items):
+    """Готовый JSON справочника из кэша со строгим ETag."""
+    return json_response(request, *reference_list_payload(
+        reference_data.get(), serializer_class, items))
+
+
+def search_ingredient_ids(params):
+    """Id ингредиентов из повторяющегося или перечисленного через запятую
+    параметра ingredients; None, если параметр некорректен."""
+    values = [value for param in params.getlist('ingredients')
+              for value in param.split(',') if value]
+    if (not values or len(values) > settings.MAX_SEARCH_INGREDIENTS
+            or not all(value.isdigit() for value in values)):
+        return None
+    return {int(value) for value in values}
+
+
+def autocomplete_limit(params):
+    """Число подсказок из параметра limit, не больше допустимого."""
+    limit = params.get('limit', '')
+    return (min(int(limit), settings.MAX_AUTOCOMPLETE_ITEMS)
+            if limit.isdigit() and int(limit)
+            else settings.MAX_AUTOCOMPLETE_ITEMS)
+
+
+class ReferenceObjectMixin:
+    """Получение объекта справочника из кэша вместо базы данных."""
+
+    reference_index = None
+
+    def get_object(self):
+        index = getattr(reference_data.get(), self.reference_index)
+        try:
+            obj = index[int(self.kwargs[self.lookup_field])]
+        except (KeyError, ValueError):
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+
+class TagView(ReferenceObjectMixin, viewsets.ModelViewSet):
     """Представления тегов."""
 
     serializer_class = TagSerializer
@@ -38,9 +108,13 @@ class TagView(viewsets.ModelViewSet):
     permission_classes = (AllowAny,)
     http_method_names = ('get', 'head', 'options')
     pagination_class = None
+    reference_index = 'tags_by_id'
 
+    def list(self, request, *args, **kwargs):
+        return reference_list_response(request, TagSerializer, 'tags')
 
-class IngredientView(viewsets.ModelViewSet):
+
+class IngredientView(ReferenceObjectMixin, viewsets.ModelViewSet):
     """Представления ингредиентов."""
 
     serializer_class = IngredientSerializer
@@ -51,17 +125,136 @@ class IngredientView(viewsets.ModelViewSet):
     permission_classes = (AllowAny,)
     http_method_names = ('get', 'head', 'options')
     pagination_class = None
+    reference_index = 'ingredients_by_id'
+
+    def list(self, request, *args, **kwargs):
+        if 'search' in request.query_params:
+            return super().list(request, *args, **kwargs)
+        name = request.query_params.get('name')
+        if name is None:
+            return reference_list_response(
+                request, IngredientSerializer, 'ingredients')
+        ingredients = [
+            ingredient for ingredient in reference_data.get().ingredients
+            if ingredient.name.startswith(name)
+        ]
+        serializer = self.get_serializer(ingredients, many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=('GET',), url_path='autocomplete')
+    def autocomplete(self, request):
+        """Подсказки ингредиентов: сначала совпадения по началу названия."""
+        ingredients = autocomplete_ingredients(
+            request.query_params.get('name', ''),
+            autocomplete_limit(request.query_params))
+        serializer = self.get_serializer(ingredients, many=True)
+        return Response(serializer.data)
 
 
 class RecipesViewSet(viewsets.ModelViewSet):
     """Вьюсет для работы с рецептами."""
 
-    filter_backends = (DjangoFilterBackend,)
+    filter_backends = (DjangoFilterBackend, RecipeOrderingFilter)
     filterset_class = RecipeFilter
-    pagination_class = Pagination
+    ordering_fields = ('created_at', 'favorites_count')
+    pagination_class = RecipePagination
     queryset = Recipe.objects.all()
     serializer_class = ReadRecipeSerializer
 
+    def get_queryset(self):
+        """Рецепты со связями и флагами текущего пользователя.
+
+        Для списка и детального просмотра нужны только id: представления
+        рецептов берутся из кэша, флаги пользователя накладываются сверху.
+        """
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            return queryset.only('id', 'created_at')
+        return queryset.with_related().with_user_flags(self.request.user)
+
+    def is_response_cacheable(self, request):
+        """Ответ анонимному пользователю в JSON не зависит от пользователя."""
+        return (not request.user.is_authenticated
+                and request.accepted_renderer.format == 'json')
+
+    def build_bodies(self, recipe_ids):
+        """Представления рецептов без флагов пользователя."""
+        recipes = Recipe.objects.with_related().with_user_flags(
+            AnonymousUser()).filter(id__in=recipe_ids)
+        return {
+            recipe.id: ReadRecipeSerializer(
+                recipe, context=self.get_serializer_context()).data
+            for recipe in recipes
+        }
+
+    def recipe_representations(self, recipe_ids):
+        """Представления рецептов с флагами текущего пользователя."""
+        bodies = get_recipe_bodies(self.request, recipe_ids,
+                                   self.build_bodies)
+        recipe_ids = [recipe_id for recipe_id in recipe_ids
+                      if recipe_id in bodies]
+        user = self.request.user
+        if not user.is_authenticated:
+            return [bodies[recipe_id] for recipe_id in recipe_ids]
+        flags = {
+            recipe_id: (is_favorited, is_in_shopping_cart, is_subscribed)
+            for recipe_id, is_favorited, is_in_shopping_cart, is_subscribed
+            in Recipe.objects.filter(id__in=recipe_ids)
+            .with_user_flags(user).order_by().values_list(
+                'id', 'is_favorited', 'is_in_shopping_cart',
+                'author_is_subscribed')
+        }
+        representations = []
+        for recipe_id in recipe_ids:
+            body = bodies[recipe_id]
+            is_favorited, is_in_shopping_cart, is_subscribed = flags.get(
+                recipe_id, (False, False, False))
+            representations.append({
+                **body,
+                'author': {**body['author'], 'is_subscribed': is_subscribed},
+                'is_favorited': is_favorited,
+                'is_in_shopping_cart': is_in_shopping_cart,
+            })
+        return representations
+
+    def list(self, request, *args, **kwargs):
+        if not self.is_response_cacheable(request):
+            return self.build_list(request)
+        return cached_json_response(
+            request, recipe_list_key(request),
+            partial(self.build_list, request))
+
+    def retrieve(self, request, *args, **kwargs):
+        if not kwargs['pk'].isdigit():
+            raise Http404
+        recipe_id = int(kwargs['pk'])
+        if not self.is_response_cacheable(request):
+            return self.build_detail(recipe_id)
+        return cached_json_response(
+            request, recipe_detail_key(recipe_id),
+            partial(self.build_detail, recipe_id), author_dependencies)
+
+    def build_list(self, request):
+        page = self.paginate_queryset(
+            self.filter_queryset(self.get_queryset()))
+        return self.get_paginated_response(
+            self.recipe_representations([recipe.id for recipe in page]))
+
+    def build_detail(self, recipe_id):
+        representations = self.recipe_representations([recipe_id])
+        if not representations:
+            raise Http404
+        return Response(representations[0])
+
+    def perform_destroy(self, instance):
+        users = list(instance.in_shopping_cart.values_list('user_id',
+                                                           flat=True))
+        ingredients = list(instance.recipe_ingredients.values_list(
+            'ingredient_id', flat=True))
+        with transaction.atomic():
+            instance.delete()
+            refresh_shopping_list(users, ingredients)
+
     def get_permissions(self):
         """Получение класса ограничения."""
         if self.action in ('list', 'retrieve', 'generate_short_link'):
@@ -99,50 +292,123 @@ class RecipesViewSet(viewsets.ModelViewSet):
             permission_classes=(IsAuthenticated,))
     def favorite(self, request, pk=None):
         """Добавление/удаление рецепта в избранное."""
-        return self.handle_post_delete(request, Favorite,
-                                       FavoriteSerializer, pk)
+        with transaction.atomic():
+            return self.handle_post_delete(request, Favorite,
+                                           FavoriteSerializer, pk)
 
     @action(detail=True, methods=['POST', 'DELETE'], url_path='shopping_cart',
             permission_classes=(IsAuthenticated,),)
     def shopping_cart(self, request, pk=None):
         """Добавление/удаление рецепта из корзины."""
-        return self.handle_post_delete(request, ShoppingCart,
-                                       ShoppingCartSerializer, pk)
+        with transaction.atomic():
+            response = self.handle_post_delete(request, ShoppingCart,
+                                               ShoppingCartSerializer, pk)
+            if status.is_success(response.status_code):
+                refresh_shopping_list(
+                    (request.user.id,),
+                    RecipeIngredient.objects.filter(recipe_id=pk)
+                    .values_list('ingredient_id', flat=True))
+        return response
 
     @action(detail=False, methods=['GET'], url_path='download_shopping_cart',
-            permission_classes=(IsAuthenticated,),)
+            permission_classes=(IsAuthenticated,),
+            renderer_classes=(TextShoppingListRenderer,
+                              CSVShoppingListRenderer,
+                              JSONShoppingListRenderer))
     def download_shopping_cart(self, request):
-        """Скачать список ингредиентов из корзины."""
+        """Скачать список ингредиентов из корзины.
+
+        Формат выбирается параметром format: txt, csv или json.
+        """
         ingredients = (
-            RecipeIngredient.objects.
-            filter(recipe__in_shopping_cart__user=request.user)
-            .values('ingredient__name', 'ingredient__measurement_unit')
-            .annotate(total_amount=Sum('amount'))
-            .order_by('ingredient__name')
-        )
-        output = '\n'.join(
-            f'{num}. {item["ingredient__name"]} - '
-            f'{item["total_amount"]} '
-            f'{item["ingredient__measurement_unit"]}.'
-            for num, item in enumerate(ingredients, start=1)
+            ShoppingListItem.objects.filter(user=request.user)
+            .values(name=F('ingredient__name'),
+                    measurement_unit=F('ingredient__measurement_unit'),
+                    amount=F('total_amount'))
+            .order_by('measurement_unit', 'name')
+            .iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
         )
-        return HttpResponse(output, content_type='text/plain')
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(ingredients),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}')
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_list.{renderer.format}"')
+        return response
+
+    @action(detail=False, methods=['GET'], url_path='by_ingredients',
+            permission_classes=(AllowAny,))
+    def by_ingredients(self, request):
+        """Рецепты из имеющихся ингредиентов.
+
+        Сначала рецепты, для которых есть большая часть ингредиентов;
+        доля указана в поле coverage.
+        """
+        ingredient_ids = search_ingredient_ids(request.query_params)
+        if ingredient_ids is None:
+            return Response(
+                {'ingredients': 'Укажите от 1 до '
+                 f'{settings.MAX_SEARCH_INGREDIENTS} id ингредиентов.'},
+                status=status.HTTP_400_BAD_REQUEST)
+        paginator = Pagination()
+        page = dict(paginator.paginate_queryset(
+            ingredient_index.search(ingredient_ids), request))
+        return paginator.get_paginated_response([
+            {**representation,
+             'coverage': round(page[representation['id']], 3)}
+            for representation in self.recipe_representations(list(page))
+        ])
+
+    @action(detail=False, methods=['POST'], url_path='import',
+            permission_classes=(IsAdminUser,),
+            parser_classes=(MultiPartParser,))
+    def import_recipes(self, request):
+        """Импорт рецептов из NDJSON или zip-архива в поле file."""
+        file = request.FILES.get('file')
+        if file is None:
+            return Response({'file': 'Файл не передан.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            with open_recipe_rows(file) as rows:
+                report = RecipeImporter(request.user).run(rows)
+        except (ValueError, zipfile.BadZipFile) as error:
+            return Response({'file': str(error)},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(report, status=(
+            status.HTTP_201_CREATED if report['created']
+            else status.HTTP_400_BAD_REQUEST))
+
+    @action(detail=False, methods=['GET'], url_path='export',
+            permission_classes=(IsAdminUser,))
+    def export_recipes(self, request):
+        """Потоковая выгрузка всех рецептов в NDJSON."""
+        response = StreamingHttpResponse(
+            export_recipes(Recipe.objects.all()),
+            content_type='application/x-ndjson; charset=utf-8')
+        response['Content-Disposition'] = (
+            'attachment; filename="recipes.ndjson"')
+        return response
 
     @action(detail=True, methods=['GET'], url_path='get-link')
     def generate_short_link(self, request, pk=None):
         """Создание линка на рецепт."""
-        short_link_id = get_object_or_404(Recipe, id=pk).id
-        short_link = f'{settings.SITE_DOMAIN}/s/{short_link_id}'
+        if not pk.isdigit() or int(pk) not in live_recipes:
+            raise Http404
+        short_link = f'{settings.SITE_DOMAIN}/s/{encode_id(int(pk))}'
         return Response({'short-link': short_link})
 
 
 @api_view(['GET'])
 @permission_classes((AllowAny, ))
-def redirect_to_recipe(request, recipe_id):
+def redirect_to_recipe(request, code):
     """Редирект по короткой ссылке на детальный URL рецепта."""
-    if not Recipe.objects.filter(id=recipe_id).exists():
-        raise ValidationError(f"Рецепт с id={recipe_id} не существует")
-    return redirect(f'/recipes/{recipe_id}/')
+    recipe_id = decode_code(code)
+    if recipe_id is None or recipe_id not in live_recipes:
+        raise ValidationError(f'Рецепт с кодом {code} не существует')
+    response = redirect(f'/recipes/{recipe_id}/')
+    patch_cache_control(
+        response, public=True, max_age=settings.SHORT_LINK_CACHE_TIMEOUT)
+    return response
 
 
 class CustomTokenCreateView(TokenCreateView):
@@ -151,25 +417,27 @@ class CustomTokenCreateView(TokenCreateView):
     permission_classes = (AllowAny, )
 
     def _action(self, serializer):
-        try:
-            email = serializer.validated_data['email']
-            password = serializer.validated_data['password']
-            user = User.objects.get(email=email)
-            user = authenticate(username=email, password=password)
-            if user:
-                token, created = Token.objects.get_or_create(user=user)
-                return Response({'auth_token': token.key},
-                                status=status.HTTP_200_OK)
-            return Response({'error': 'Неверные учетные данные'},
-                            status=status.HTTP_400_BAD_REQUEST)
-        except ObjectDoesNotExist:
+        user = User.objects.select_related('auth_token').filter(
+            email=serializer.validated_data['email']).first()
+        if user is None:
             return Response({
                 'error': 'Пользователь с таким email не найден'
             }, status=status.HTTP_400_BAD_REQUEST)
-        except Exception as e:
-            return Response({
-                'error': str(e)
-            }, status=status.HTTP_400_BAD_REQUEST)
+        is_valid = check_password_bounded(
+            user, serializer.validated_data['password'])
+        if is_valid is None:
+            return Response(
+                {'error': 'Слишком много попыток входа, повторите позже'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': '1'})
+        if not is_valid or not user.is_active:
+            return Response({'error': 'Неверные учетные данные'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            token = user.auth_token
+        except Token.DoesNotExist:
+            token, created = Token.objects.get_or_create(user=user)
+        return Response({'auth_token': token.key}, status=status.HTTP_200_OK)
 
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -258,10 +526,20 @@ class CustomUserViewSet(UserViewSet):
             permission_classes=(IsAuthenticated,), )
     def get_subscriptions(self, request):
         """Получение списка подписок."""
+        recipes = Recipe.objects.all()
+        recipes_limit = request.query_params.get('recipes_limit')
+        if recipes_limit and recipes_limit.isdigit():
+            # Срез в Prefetch выполняется одним запросом через
+            # ROW_NUMBER() OVER (PARTITION BY author_id).
+            recipes = recipes[:int(recipes_limit)]
         following_users = User.objects.filter(
             subscribers__subscriber=request.user
-        ).distinct()
-        paginator = Pagination()
+        ).annotate(
+            is_subscribed=Value(True),
+        ).prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='limited_recipes')
+        ).order_by('username', 'id')
+        paginator = SubscriptionPagination()
         result_page = paginator.paginate_queryset(following_users, request)
         serializer = GetFollowSerializer(result_page, many=True,
                                          context={'request': request},)
@@ -280,13 +558,13 @@ class CustomUserViewSet(UserViewSet):
                     'recipes_limit': request.query_params.get('recipes_limit')}
             )
             serializer.is_valid(raise_exception=True)
-            serializer.save()
+            with transaction.atomic():
+                serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         elif request.method == 'DELETE':
             follow = Subscription.objects.filter(subscriber=request.user.id,
                                                  target=following.id,)
-            if follow.exists():
-                follow.delete()
+            if follow.delete()[0]:
                 return Response(status=status.HTTP_204_NO_CONTENT)
 
         return Response(status=status.HTTP_400_BAD_REQUEST)
@@ -1,8 +1,8 @@
 from django.contrib import admin
 from django.utils.safestring import mark_safe
 
-from .models import (Favorite, Ingredient, Recipe, ShoppingCart, Tag,
-                     RecipeIngredient)
+from .models import (Favorite, Ingredient, Recipe, ShoppingCart,
+                     ShoppingListItem, Tag, RecipeIngredient)
 
 EMPTY_MSG = '-пусто-'
 
@@ -43,9 +43,13 @@ class RecipeAdmin(admin.ModelAdmin):
     empty_value_display = EMPTY_MSG
     inlines = (RecipeIngredientInline,)
 
-    @admin.display(description="в избранном")
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_related()
+
+    @admin.display(description="в избранном",
+                   ordering='favorites_count')
     def get_favorites_count(self, obj):
-        return obj.favorite.count()
+        return obj.favorites_count
 
     @admin.display(description='Тэги')
     def get_tags(self, obj):
@@ -55,7 +59,7 @@ class RecipeAdmin(admin.ModelAdmin):
     @admin.display(description="ингредиенты")
     @mark_safe
     def get_ingredients(self, obj):
-        if not obj.recipe_ingredients.exists():
+        if not obj.recipe_ingredients.all():
             return "Нет ингредиентов"
         return "<br>".join(
             [
@@ -88,3 +92,11 @@ class SoppingCartAdmin(admin.ModelAdmin):
     search_fields = ('user', 'recipe')
     list_filter = ('user', 'recipe')
     empty_value_display = EMPTY_MSG
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'ingredient', 'total_amount')
+    search_fields = ('user__username', 'ingredient__name')
+    list_select_related = ('user', 'ingredient')
+    empty_value_display = EMPTY_MSG
@@ -0,0 +1,48 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from apps.accounts.models import Subscription
+from .models import Favorite, Recipe
+
+User = get_user_model()
+
+# Модель строк -> (модель со счетчиком, внешний ключ, поле счетчика).
+COUNTERS = {
+    Favorite: (Recipe, 'recipe', 'favorites_count'),
+    Recipe: (User, 'author', 'recipes_count'),
+    Subscription: (User, 'target', 'subscribers_count'),
+}
+
+
+def change_counter(queryset, field, delta):
+    """Атомарное изменение счетчика через F(), без ухода в минус."""
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def count_of(queryset, field):
+    """Подзапрос с количеством строк queryset для текущей записи."""
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')})
+        .order_by().values(field)
+        .annotate(count=Count('pk')).values('count')
+    ), 0)
+
+
+def count_row(sender, instance, delta):
+    """Изменение счетчика, в который входит строка instance."""
+    model, key, field = COUNTERS[sender]
+    change_counter(model.objects.filter(pk=getattr(instance, f'{key}_id')),
+                   field, delta)
+
+
+def recount():
+    """Исправление счетчиков, возвращает число исправленных записей."""
+    fixed = {}
+    for rows, (model, key, field) in COUNTERS.items():
+        expression = count_of(rows.objects, key)
+        fixed[f'{model._meta.model_name}.{field}'] = model.objects.exclude(
+            **{field: expression}).update(**{field: expression})
+    return fixed
@@ -0,0 +1,106 @@
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from .models import Recipe
+from .versions import (RECIPES_VERSION, bump_author, bump_version,
+                       recipe_version)
+
+logger = logging.getLogger(__name__)
+
+FORMATS = (('webp', 'WEBP'), ('jpeg', 'JPEG'))
+
+executor = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS,
+                              thread_name_prefix='image-variants')
+
+
+def make_variants(field_file, kind):
+    """Уменьшенные копии изображения в WebP и JPEG без EXIF.
+
+    Имена файлов строятся из хэша содержимого, поэтому их можно
+    кэшировать бессрочно.
+    """
+    with field_file.open('rb') as file:
+        content = file.read()
+    digest = hashlib.sha256(content).hexdigest()[:16]
+    with Image.open(BytesIO(content)) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+    sizes = {}
+    for size, dimensions in settings.IMAGE_VARIANTS[kind].items():
+        variant = image.copy()
+        variant.thumbnail(dimensions)
+        sizes[size] = {}
+        for extension, image_format in FORMATS:
+            path = f'variants/{kind}/{digest}_{size}.{extension}'
+            if not default_storage.exists(path):
+                buffer = BytesIO()
+                variant.save(buffer, image_format,
+                             quality=settings.IMAGE_VARIANTS_QUALITY)
+                path = default_storage.save(
+                    path, ContentFile(buffer.getvalue()))
+            sizes[size][extension] = path
+    return {'source': field_file.name, 'sizes': sizes}
+
+
+def build_variants(model, pk, field, variants_field, kind, invalidate):
+    """Пересборка копий и сохранение путей, если картинка не сменилась."""
+    try:
+        instance = model.objects.filter(pk=pk).first()
+        if instance is None:
+            return
+        image = getattr(instance, field)
+        queryset = model.objects.filter(pk=pk)
+        if image:
+            variants = make_variants(image, kind)
+            queryset = queryset.filter(**{field: image.name})
+        else:
+            variants = {}
+        if queryset.update(**{variants_field: variants}):
+            invalidate(pk)
+    except Exception:
+        logger.exception('Не удалось создать копии изображения %s %s',
+                         model._meta.label, pk)
+    finally:
+        if settings.IMAGE_VARIANTS_ASYNC:
+            close_old_connections()
+
+
+def invalidate_recipe(pk):
+    bump_version(RECIPES_VERSION)
+    bump_version(recipe_version(pk))
+
+
+def invalidate_author(pk):
+    bump_author(pk, Recipe.objects.filter(author_id=pk).exists())
+
+
+def schedule_variants(instance, field, variants_field, kind, invalidate):
+    """Создание копий после коммита, если исходная картинка сменилась."""
+    image = getattr(instance, field)
+    variants = getattr(instance, variants_field)
+    if (image.name or None) == variants.get('source'):
+        return
+    job = partial(build_variants, type(instance), instance.pk, field,
+                  variants_field, kind, invalidate)
+    if settings.IMAGE_VARIANTS_ASYNC:
+        transaction.on_commit(partial(executor.submit, job))
+    else:
+        transaction.on_commit(job)
+
+
+def schedule_recipe_variants(recipe):
+    schedule_variants(recipe, 'image', 'image_variants', 'recipe',
+                      invalidate_recipe)
+
+
+def schedule_avatar_variants(user):
+    schedule_variants(user, 'avatar', 'avatar_variants', 'avatar',
+                      invalidate_author)
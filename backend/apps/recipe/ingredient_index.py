@@ -0,0 +1,190 @@
+import time
+from array import array
+from collections import Counter, OrderedDict, defaultdict
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from .models import RecipeIngredient
+from .versions import INGREDIENT_INDEX_VERSION, get_versions
+
+
+def log_key(number):
+    return f'ingredient_index_log:{number}'
+
+
+class IndexState:
+    """Обратный индекс ингредиент -> id рецептов на момент записи журнала.
+
+    Списки рецептов не изменяются на месте, а заменяются новыми, поэтому
+    поиск может читать их без блокировки.
+    """
+
+    def __init__(self, number, postings, recipes):
+        self.number = number
+        self.postings = postings
+        self.recipes = recipes
+        self.results = OrderedDict()
+        # Сколько пар (рецепт, доля) хранится во всех запомненных ответах.
+        self.results_size = 0
+
+    def clear_results(self):
+        self.results.clear()
+        self.results_size = 0
+
+    def remember(self, key, ranked):
+        """Запоминание ответа; память ограничена числом пар, а не
+        ответов: один частый ингредиент дает список почти всех рецептов."""
+        limit = settings.INGREDIENT_SEARCH_CACHE_ENTRIES
+        if len(ranked) > limit or key in self.results:
+            return
+        self.results[key] = ranked
+        self.results_size += len(ranked)
+        while self.results_size > limit:
+            self.results_size -= len(self.results.popitem(last=False)[1])
+
+
+class IngredientIndex:
+    """Поиск рецептов по ингредиентам в памяти процесса.
+
+    Изменения рецептов пишутся в общий кэш журналом с порядковыми
+    номерами, процессы применяют их перед поиском. Если журнал отстал
+    больше чем на INGREDIENT_INDEX_MAX_LAG записей или часть записей
+    вытеснена, индекс строится заново. Строки читаются из основной базы:
+    запись журнала появляется после коммита, и реплика в этот момент
+    может вернуть старый состав рецепта, который индекс уже не перечитает.
+    """
+
+    def __init__(self):
+        self._state = None
+        self._lock = Lock()
+
+    def build(self, number):
+        postings = defaultdict(lambda: array('I'))
+        recipes = defaultdict(list)
+        rows = RecipeIngredient.objects.using(DEFAULT_DB_ALIAS).values_list(
+            'recipe_id', 'ingredient_id').iterator(
+                chunk_size=settings.EXPORT_CHUNK_SIZE)
+        for recipe_id, ingredient_id in rows:
+            postings[ingredient_id].append(recipe_id)
+            recipes[recipe_id].append(ingredient_id)
+        return IndexState(
+            number, dict(postings),
+            {recipe_id: tuple(ingredients)
+             for recipe_id, ingredients in recipes.items()})
+
+    def apply(self, state, number, recipe_ids):
+        """Пересборка записей индекса для измененных рецептов."""
+        current = defaultdict(tuple)
+        for recipe_id, ingredient_id in RecipeIngredient.objects.using(
+                DEFAULT_DB_ALIAS).filter(recipe_id__in=recipe_ids).values_list(
+                    'recipe_id', 'ingredient_id'):
+            current[recipe_id] += (ingredient_id,)
+        postings, recipes = state.postings, state.recipes
+        removed, added = defaultdict(set), defaultdict(list)
+        for recipe_id in recipe_ids:
+            old = set(recipes.get(recipe_id, ()))
+            new = set(current[recipe_id])
+            for ingredient_id in old - new:
+                removed[ingredient_id].add(recipe_id)
+            for ingredient_id in new - old:
+                added[ingredient_id].append(recipe_id)
+            if new:
+                recipes[recipe_id] = current[recipe_id]
+            else:
+                recipes.pop(recipe_id, None)
+        for ingredient_id in removed.keys() | added.keys():
+            posting = postings.get(ingredient_id, ())
+            if ingredient_id in removed:
+                posting = (item for item in posting
+                           if item not in removed[ingredient_id])
+            posting = array('I', posting)
+            posting.extend(added[ingredient_id])
+            postings[ingredient_id] = posting
+        state.clear_results()
+        state.number = number
+
+    def get(self):
+        """Индекс, догнанный до последней записи журнала."""
+        number = get_versions(
+            INGREDIENT_INDEX_VERSION)[INGREDIENT_INDEX_VERSION]
+        state = self._state
+        if state is not None and state.number == number:
+            return state
+        with self._lock:
+            state = self._state
+            if state is None or not (
+                    0 <= number - state.number
+                    <= settings.INGREDIENT_INDEX_MAX_LAG):
+                self._state = self.build(number)
+                return self._state
+            keys = [log_key(item)
+                    for item in range(state.number + 1, number + 1)]
+            entries = cache.get_many(keys)
+            if len(entries) != len(keys):
+                self._state = self.build(number)
+                return self._state
+            self.apply(state, number, {recipe_id for key in keys
+                                       for recipe_id in entries[key]})
+        return state
+
+    def rank(self, state, ingredient_ids):
+        matches = Counter()
+        for ingredient_id in ingredient_ids:
+            matches.update(state.postings.get(ingredient_id, ()))
+        # Рецептов много, а различных пар (совпало, всего) мало: рецепты
+        # раскладываются по парам, и сортируются только сами пары.
+        buckets = defaultdict(list)
+        for recipe_id, count in matches.items():
+            ingredients = state.recipes.get(recipe_id)
+            if ingredients:
+                buckets[count, len(ingredients)].append(recipe_id)
+        ranked = []
+        for count, total in sorted(
+                buckets, key=lambda pair: (pair[0] / pair[1], pair[0]),
+                reverse=True):
+            coverage = count / total
+            ranked.extend(
+                (recipe_id, coverage)
+                for recipe_id in sorted(buckets[count, total], reverse=True))
+        return ranked
+
+    def search(self, ingredient_ids):
+        """Рецепты с любым из ингредиентов по убыванию доли совпадений.
+
+        Возвращает пары (id рецепта, доля его ингредиентов из запроса);
+        результат запоминается до следующего изменения индекса, если
+        влезает в INGREDIENT_SEARCH_CACHE_ENTRIES пар.
+        """
+        state = self.get()
+        key = frozenset(ingredient_ids)
+        with self._lock:
+            if key in state.results:
+                state.results.move_to_end(key)
+                return state.results[key]
+        number = state.number
+        ranked = self.rank(state, key)
+        with self._lock:
+            if state.number == number:
+                state.remember(key, ranked)
+        return ranked
+
+    def changed(self, *recipe_ids):
+        """Запись в журнал после коммита; без id индекс строится заново."""
+        def record():
+            if not recipe_ids:
+                cache.set(INGREDIENT_INDEX_VERSION, time.time_ns(),
+                          timeout=None)
+                return
+            try:
+                number = cache.incr(INGREDIENT_INDEX_VERSION)
+            except ValueError:
+                return
+            cache.set(log_key(number), recipe_ids,
+                      settings.INGREDIENT_INDEX_LOG_TIMEOUT)
+        transaction.on_commit(record)
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,58 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from apps.recipe.models import (Favorite, Recipe, ShoppingCart,
+                                ShoppingListItem)
+
+SEQ_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+
+def hot_queries():
+    """Запросы горячих путей API, которые должны идти по индексам."""
+    return {
+        'лента рецептов': Recipe.objects.order_by('-created_at', '-id')[:6],
+        'рецепты автора': Recipe.objects.filter(
+            author_id=1).order_by('-created_at')[:6],
+        'фильтр по тэгам': Recipe.tags.through.objects.filter(
+            tag_id__in=(1, 2, 3)).values('recipe_id'),
+        'популярные рецепты': Recipe.objects.order_by(
+            '-favorites_count', '-created_at')[:6],
+        'рецепт в избранном': Favorite.objects.filter(
+            user_id=1, recipe_id=1),
+        'избранное пользователя': Recipe.objects.filter(
+            favorite__user_id=1).order_by('-created_at')[:6],
+        'рецепт в корзине': ShoppingCart.objects.filter(
+            user_id=1, recipe_id=1),
+        'корзина пользователя': Recipe.objects.filter(
+            in_shopping_cart__user_id=1).order_by('-created_at')[:6],
+        'список покупок': ShoppingListItem.objects.filter(user_id=1),
+    }
+
+
+class Command(BaseCommand):
+    help = ('Проверка планов горячих запросов: при выключенном Seq Scan '
+            'план с Seq Scan означает, что подходящего индекса нет')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stdout.write('Проверка планов доступна только в PostgreSQL.')
+            return
+        failed = []
+        for name, queryset in hot_queries().items():
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+                plan = queryset.explain()
+            tables = SEQ_SCAN.findall(plan)
+            if tables:
+                failed.append(name)
+                self.stdout.write(self.style.ERROR(
+                    f'{name}: Seq Scan по {", ".join(tables)}\n{plan}'))
+            else:
+                self.stdout.write(f'{name}: OK')
+        if failed:
+            raise CommandError(
+                f'Запросы без подходящего индекса: {", ".join(failed)}.')
+        self.stdout.write(self.style.SUCCESS('Все запросы идут по индексам.'))
@@ -0,0 +1,40 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from apps.recipe.images import (build_variants, invalidate_author,
+                                invalidate_recipe)
+from apps.recipe.models import Recipe
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Создание уменьшенных копий картинок рецептов и аватаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Пересоздать копии, даже если они уже есть.')
+
+    def handle(self, *args, **options):
+        targets = (
+            (Recipe, 'image', 'image_variants', 'recipe', invalidate_recipe),
+            (User, 'avatar', 'avatar_variants', 'avatar', invalidate_author),
+        )
+        for model, field, variants_field, kind, invalidate in targets:
+            queryset = (model.objects.exclude(**{f'{field}__isnull': True})
+                        .exclude(**{field: ''})
+                        .only('pk', field, variants_field))
+            built = 0
+            for instance in queryset.iterator():
+                image = getattr(instance, field)
+                variants = getattr(instance, variants_field)
+                if not options['force'] and (
+                        variants.get('source') == image.name):
+                    continue
+                build_variants(model, instance.pk, field, variants_field,
+                               kind, invalidate)
+                built += 1
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: обработано {built}.')
+        self.stdout.write(self.style.SUCCESS('Копии изображений созданы.'))
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.recipe.models import ShoppingListItem
+from apps.recipe.shopping_list import cart_totals
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Пересборка списков покупок по корзинам с отчетом о расхождениях'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать расхождения, ничего не менять.')
+        parser.add_argument(
+            '--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+            help='Количество строк в одном INSERT.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            expected = {
+                (user_id, ingredient_id): total_amount
+                for user_id, ingredient_id, total_amount in cart_totals()
+            }
+            actual = {
+                (user_id, ingredient_id): total_amount
+                for user_id, ingredient_id, total_amount
+                in ShoppingListItem.objects.select_for_update().values_list(
+                    'user', 'ingredient', 'total_amount')
+            }
+            missing = expected.keys() - actual.keys()
+            stale = actual.keys() - expected.keys()
+            wrong = [key for key in expected.keys() & actual.keys()
+                     if expected[key] != actual[key]]
+            self.stdout.write(
+                f'Позиций: {len(expected)}. Отсутствуют: {len(missing)}, '
+                f'лишние: {len(stale)}, с неверным количеством: {len(wrong)}.'
+            )
+            if options['dry_run'] or not (missing or stale or wrong):
+                return
+            ShoppingListItem.objects.all().delete()
+            ShoppingListItem.objects.bulk_create(
+                (ShoppingListItem(user_id=user_id,
+                                  ingredient_id=ingredient_id,
+                                  total_amount=total_amount)
+                 for (user_id, ingredient_id), total_amount
+                 in expected.items()),
+                batch_size=options['batch_size'],
+            )
+        self.stdout.write(self.style.SUCCESS('Списки покупок пересобраны.'))
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.20 on 2026-10-18 02:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_shopping_lists(apps, schema_editor):
+    RecipeIngredient = apps.get_model('recipe', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('recipe', 'ShoppingListItem')
+    totals = (
+        RecipeIngredient.objects
+        .filter(recipe__in_shopping_cart__user__isnull=False)
+        .values_list('recipe__in_shopping_cart__user', 'ingredient')
+        .annotate(total_amount=models.Sum('amount'))
+        .order_by()
+    )
+    ShoppingListItem.objects.bulk_create(
+        ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                         total_amount=total_amount)
+        for user_id, ingredient_id, total_amount in totals
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipe', '0003_ingredient_name_trgm'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_amount', models.PositiveIntegerField(verbose_name='Общее количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_items', to='recipe.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Позиция списка покупок',
+                'verbose_name_plural': 'Списки покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_shopping_list_item'),
+        ),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
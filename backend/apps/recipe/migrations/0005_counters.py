@@ -0,0 +1,45 @@
+# Generated by Django 4.2.20 on 2026-10-18 02:31
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_of(queryset, field):
+    return Coalesce(models.Subquery(
+        queryset.filter(**{field: models.OuterRef('pk')})
+        .order_by().values(field)
+        .annotate(count=models.Count('pk')).values('count')
+    ), 0)
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipe', 'Recipe')
+    Favorite = apps.get_model('recipe', 'Favorite')
+    User = apps.get_model('accounts', 'User')
+    Subscription = apps.get_model('accounts', 'Subscription')
+    Recipe.objects.update(
+        favorites_count=count_of(Favorite.objects, 'recipe'))
+    User.objects.update(
+        recipes_count=count_of(Recipe.objects, 'author'),
+        subscribers_count=count_of(Subscription.objects, 'target'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_user_recipes_count_user_subscribers_count'),
+        ('recipe', '0004_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='В избранном'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-created_at'], name='recipe_popular_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
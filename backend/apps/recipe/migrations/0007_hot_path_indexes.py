@@ -0,0 +1,56 @@
+# Generated by Django 4.2.20 on 2026-10-18 02:36
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def remove_duplicates(apps, schema_editor):
+    Favorite = apps.get_model('recipe', 'Favorite')
+    ShoppingCart = apps.get_model('recipe', 'ShoppingCart')
+    ShoppingCart.objects.filter(
+        models.Q(user__isnull=True) | models.Q(recipe__isnull=True)
+    ).delete()
+    for model in (Favorite, ShoppingCart):
+        keep = (model.objects.values('user', 'recipe')
+                .annotate(keep_id=models.Min('id')).values('keep_id'))
+        model.objects.exclude(id__in=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipe', '0006_recipe_feed_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='shoppingcart',
+            name='recipe',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='in_shopping_cart', to='recipe.recipe', verbose_name='Покупка'),
+        ),
+        migrations.AlterField(
+            model_name='shoppingcart',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_cart', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-created_at'], name='recipe_author_feed_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_favorite'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_shopping_cart'),
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX recipe_recipe_tags_tag_recipe_idx '
+            'ON recipe_recipe_tags (tag_id, recipe_id)',
+            'DROP INDEX recipe_recipe_tags_tag_recipe_idx',
+        ),
+    ]
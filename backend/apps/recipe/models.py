@@ -72,6 +72,44 @@ class Tag(TimeStampModel):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    """Запросы к рецептам."""
+
+    @staticmethod
+    def related_lookups():
+        """Связи, которые нужны для полного представления рецепта."""
+        return (
+            'tags',
+            models.Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related('ingredient'),
+            ),
+        )
+
+    def with_related(self):
+        """Рецепты с автором, тэгами и ингредиентами."""
+        return self.select_related('author').prefetch_related(
+            *self.related_lookups()
+        )
+
+    def with_user_flags(self, user):
+        """Рецепты с флагами избранного, корзины и подписки на автора."""
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=models.Value(False),
+                is_in_shopping_cart=models.Value(False),
+                author_is_subscribed=models.Value(False),
+            )
+        return self.annotate(
+            is_favorited=models.Exists(Favorite.objects.filter(
+                user=user, recipe=models.OuterRef('pk'))),
+            is_in_shopping_cart=models.Exists(ShoppingCart.objects.filter(
+                user=user, recipe=models.OuterRef('pk'))),
+            author_is_subscribed=models.Exists(
+                user.subscriptions.filter(target=models.OuterRef('author'))),
+        )
+
+
 class Recipe(TimeStampModel):
     """Модель Рецептов."""
     author = models.ForeignKey(
@@ -88,6 +126,12 @@ class Recipe(TimeStampModel):
         verbose_name='Изображение рецепта',
         upload_to='recipe_images/'
     )
+    image_variants = models.JSONField(
+        verbose_name='Уменьшенные копии изображения',
+        default=dict,
+        blank=True,
+        editable=False,
+    )
     text = models.TextField(
         verbose_name='Описание рецепта',
     )
@@ -104,11 +148,25 @@ class Recipe(TimeStampModel):
         verbose_name='Время приготовления',
         validators=[MinValueValidator(1)]
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-created_at', )
+        indexes = [
+            models.Index(fields=['-favorites_count', '-created_at'],
+                         name='recipe_popular_idx'),
+            models.Index(fields=['-created_at', '-id'],
+                         name='recipe_feed_idx'),
+            models.Index(fields=['author', '-created_at'],
+                         name='recipe_author_feed_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -170,6 +228,12 @@ class Favorite(TimeStampModel):
     class Meta:
         verbose_name = 'Избранный рецепт'
         verbose_name_plural = 'Избранные рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_favorite'
+            )
+        ]
 
     def __str__(self):
         return f'{self.user.username} - {self.recipe.name}'
@@ -181,18 +245,54 @@ class ShoppingCart(models.Model):
         User,
         on_delete=models.CASCADE,
         related_name='shopping_cart',
-        verbose_name='Пользователь',
-        null=True)
+        verbose_name='Пользователь')
     recipe = models.ForeignKey(
         Recipe,
         on_delete=models.CASCADE,
         related_name='in_shopping_cart',
-        verbose_name='Покупка',
-        null=True)
+        verbose_name='Покупка')
 
     class Meta:
         verbose_name = 'Покупка'
         verbose_name_plural = 'Покупки'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_shopping_cart'
+            )
+        ]
 
     def __str__(self):
         return f'{self.user.username} - {self.recipe.name}'
+
+
+class ShoppingListItem(models.Model):
+    """Модель списка покупок: итог по ингредиенту в корзине пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент',
+    )
+    total_amount = models.PositiveIntegerField(
+        verbose_name='Общее количество',
+    )
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Списки покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user.username} - {self.ingredient.name}'
@@ -0,0 +1,102 @@
+from threading import Lock
+
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import Ingredient, Tag
+from .versions import (REFERENCE_VERSION, aget_versions, bump_version,
+                       get_versions)
+
+
+class Snapshot:
+    """Неизменяемый снимок тэгов и ингредиентов одной версии."""
+
+    def __init__(self, version, tags, ingredients):
+        self.version = version
+        self.tags = tuple(tags)
+        self.ingredients = tuple(ingredients)
+        self.tags_by_id = {tag.id: tag for tag in self.tags}
+        self.tags_by_slug = {tag.slug: tag for tag in self.tags}
+        self.ingredients_by_id = {
+            ingredient.id: ingredient for ingredient in self.ingredients
+        }
+        self._memo = {}
+        self._lock = Lock()
+
+    def memo(self, key, build):
+        """Значение, которое вычисляется один раз для версии справочников."""
+        try:
+            return self._memo[key]
+        except KeyError:
+            with self._lock:
+                if key not in self._memo:
+                    self._memo[key] = build(self)
+                return self._memo[key]
+
+
+class ReferenceData:
+    """Кэш справочников в памяти процесса.
+
+    Актуальность проверяется по номеру версии в общем кэше, который
+    увеличивается при любом изменении тэгов и ингредиентов.
+    """
+
+    INDEXES = {Tag: 'tags_by_id', Ingredient: 'ingredients_by_id'}
+
+    def __init__(self):
+        self._snapshot = None
+        self._lock = Lock()
+
+    def get(self):
+        """Снимок текущей версии.
+
+        Строится по основной базе: реплика может отставать от изменения,
+        которое увеличило версию, а снимок живет до следующего изменения.
+        """
+        version = get_versions(REFERENCE_VERSION)[REFERENCE_VERSION]
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != version:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or snapshot.version != version:
+                    snapshot = Snapshot(
+                        version,
+                        Tag.objects.using(DEFAULT_DB_ALIAS),
+                        Ingredient.objects.using(DEFAULT_DB_ALIAS))
+                    self._snapshot = snapshot
+        return snapshot
+
+    async def aget(self):
+        """Асинхронный вариант get().
+
+        Снимок строится без блокировки, при гонке выигрывает последний.
+        """
+        version = (await aget_versions(REFERENCE_VERSION))[REFERENCE_VERSION]
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != version:
+            snapshot = Snapshot(
+                version,
+                [tag async for tag in Tag.objects.using(DEFAULT_DB_ALIAS)],
+                [ingredient async for ingredient
+                 in Ingredient.objects.using(DEFAULT_DB_ALIAS)])
+            self._snapshot = snapshot
+        return snapshot
+
+    def resolve(self, model, ids):
+        """Тэги или ингредиенты по id.
+
+        Берутся из снимка, отсутствующие в нем ищутся одним запросом.
+        Неизвестных id в результате нет.
+        """
+        known = getattr(self.get(), self.INDEXES[model])
+        found = {pk: known[pk] for pk in ids if pk in known}
+        missing = set(ids) - found.keys()
+        if missing:
+            found.update(model.objects.in_bulk(missing))
+        return found
+
+    def invalidate(self):
+        self._snapshot = None
+        bump_version(REFERENCE_VERSION)
+
+
+reference_data = ReferenceData()
@@ -0,0 +1,70 @@
+from bisect import bisect_left
+from operator import itemgetter
+
+from django.db import connections, router
+from django.db.models import Case, IntegerField, Value, When
+
+from .models import Ingredient
+from .reference import reference_data
+
+
+def _build_prefix_index(snapshot):
+    """Отсортированный массив названий ингредиентов в нижнем регистре."""
+    rows = sorted(
+        ((ingredient.name.lower(), ingredient)
+         for ingredient in snapshot.ingredients),
+        key=itemgetter(0),
+    )
+    return [key for key, _ in rows], rows
+
+
+def _search_prefix_index(snapshot, query, limit):
+    """Поиск в памяти: сначала совпадения по префиксу, затем по подстроке.
+
+    Используется, когда база данных не PostgreSQL и триграммного индекса нет.
+    """
+    keys, rows = snapshot.memo('ingredient_prefix_index', _build_prefix_index)
+    query = query.lower()
+    result = []
+    position = bisect_left(keys, query)
+    while (position < len(keys) and len(result) < limit
+           and keys[position].startswith(query)):
+        result.append(rows[position][1])
+        position += 1
+    for key, ingredient in rows:
+        if len(result) >= limit:
+            break
+        if query in key and not key.startswith(query):
+            result.append(ingredient)
+    return result
+
+
+def _uses_prefix_index():
+    return connections[router.db_for_read(Ingredient)].vendor != 'postgresql'
+
+
+def _ranked_ingredients(query, limit):
+    return (
+        Ingredient.objects.filter(name__icontains=query)
+        .annotate(rank=Case(
+            When(name__istartswith=query, then=Value(0)),
+            default=Value(1),
+            output_field=IntegerField(),
+        ))
+        .order_by('rank', 'name')[:limit]
+    )
+
+
+def autocomplete_ingredients(query, limit):
+    """Подсказки ингредиентов по части названия."""
+    if _uses_prefix_index():
+        return _search_prefix_index(reference_data.get(), query, limit)
+    return list(_ranked_ingredients(query, limit))
+
+
+async def aautocomplete_ingredients(query, limit):
+    """Асинхронный вариант autocomplete_ingredients."""
+    if _uses_prefix_index():
+        return _search_prefix_index(await reference_data.aget(), query, limit)
+    return [ingredient async for ingredient
+            in _ranked_ingredients(query, limit)]
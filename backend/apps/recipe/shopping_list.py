@@ -0,0 +1,43 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Sum
+
+from .models import RecipeIngredient, ShoppingListItem
+
+
+def cart_totals(**filters):
+    """Суммы ингредиентов по корзинам: (user_id, ingredient_id, amount)."""
+    return (
+        RecipeIngredient.objects
+        .filter(recipe__in_shopping_cart__isnull=False, **filters)
+        .values_list('recipe__in_shopping_cart__user', 'ingredient')
+        .annotate(total_amount=Sum('amount'))
+        .order_by()
+    )
+
+
+def refresh_shopping_list(user_ids, ingredient_ids):
+    """Пересчет позиций списка покупок для пользователей и ингредиентов.
+
+    Строки пользователей блокируются до конца транзакции, и суммы
+    считаются уже под блокировкой: параллельные изменения корзины
+    одного пользователя пересчитываются по очереди и видят друг друга.
+    """
+    user_ids, ingredient_ids = set(user_ids), set(ingredient_ids)
+    if not user_ids or not ingredient_ids:
+        return
+    with transaction.atomic():
+        list(get_user_model().objects.select_for_update()
+             .filter(pk__in=user_ids).order_by('pk')
+             .values_list('pk', flat=True))
+        items = [
+            ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                             total_amount=total_amount)
+            for user_id, ingredient_id, total_amount in cart_totals(
+                recipe__in_shopping_cart__user__in=user_ids,
+                ingredient__in=ingredient_ids,
+            )
+        ]
+        ShoppingListItem.objects.filter(
+            user__in=user_ids, ingredient__in=ingredient_ids).delete()
+        ShoppingListItem.objects.bulk_create(items)
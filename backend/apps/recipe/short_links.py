@@ -0,0 +1,108 @@
+import string
+from threading import Lock
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import Recipe
+from .versions import (RECIPE_IDS_VERSION, aget_versions, bump_version,
+                       get_versions)
+
+# Только буквы: код никогда не совпадает со старыми ссылками вида /s/<id>.
+ALPHABET = string.ascii_letters
+BASE = len(ALPHABET)
+INDEX = {char: position for position, char in enumerate(ALPHABET)}
+
+
+def encode_id(recipe_id):
+    """Короткий код рецепта."""
+    code = ''
+    while True:
+        recipe_id, remainder = divmod(recipe_id, BASE)
+        code = ALPHABET[remainder] + code
+        if not recipe_id:
+            return code
+
+
+def decode_code(code):
+    """id рецепта по коду или по старому числовому id, иначе None."""
+    if code.isdigit():
+        return int(code)
+    recipe_id = 0
+    for char in code:
+        if char not in INDEX:
+            return None
+        recipe_id = recipe_id * BASE + INDEX[char]
+    return recipe_id
+
+
+def build_bitmap(recipe_ids):
+    recipe_ids = list(recipe_ids)
+    bitmap = bytearray(max(recipe_ids, default=0) // 8 + 1)
+    for recipe_id in recipe_ids:
+        bitmap[recipe_id // 8] |= 1 << recipe_id % 8
+    return bytes(bitmap)
+
+
+# Одна запись (версия, карта): карта прошлой версии перезаписывается,
+# а не остается в кэше рядом с новой.
+BITMAP_KEY = 'recipe_ids_bitmap'
+
+
+class LiveRecipes:
+    """Битовая карта id существующих рецептов.
+
+    Хранится в памяти процесса и в общем кэше вместе с номером версии,
+    который увеличивается при создании и удалении рецептов. Карта
+    кэшируется без срока, поэтому id читаются из основной базы, а не
+    из реплики, которая может еще не видеть нового рецепта.
+    """
+
+    def __init__(self):
+        self._state = (None, b'')
+        self._lock = Lock()
+
+    @staticmethod
+    def _contains(bitmap, recipe_id):
+        return (0 < recipe_id < len(bitmap) * 8
+                and bool(bitmap[recipe_id // 8] & 1 << recipe_id % 8))
+
+    def __contains__(self, recipe_id):
+        version = get_versions(RECIPE_IDS_VERSION)[RECIPE_IDS_VERSION]
+        current, bitmap = self._state
+        if version != current:
+            with self._lock:
+                current, bitmap = self._state
+                if version != current:
+                    state = cache.get(BITMAP_KEY)
+                    if state is None or state[0] != version:
+                        state = (version, build_bitmap(
+                            Recipe.objects.using(DEFAULT_DB_ALIAS)
+                            .values_list('id', flat=True).iterator()))
+                        cache.set(BITMAP_KEY, state, None)
+                    self._state = state
+                    bitmap = state[1]
+        return self._contains(bitmap, recipe_id)
+
+    async def acontains(self, recipe_id):
+        """Асинхронный вариант проверки `recipe_id in live_recipes`."""
+        version = (
+            await aget_versions(RECIPE_IDS_VERSION))[RECIPE_IDS_VERSION]
+        current, bitmap = self._state
+        if version != current:
+            state = await cache.aget(BITMAP_KEY)
+            if state is None or state[0] != version:
+                state = (version, build_bitmap([
+                    recipe_id async for recipe_id
+                    in Recipe.objects.using(DEFAULT_DB_ALIAS)
+                    .values_list('id', flat=True)]))
+                await cache.aset(BITMAP_KEY, state, None)
+            self._state = state
+            bitmap = state[1]
+        return self._contains(bitmap, recipe_id)
+
+    def invalidate(self):
+        bump_version(RECIPE_IDS_VERSION)
+
+
+live_recipes = LiveRecipes()
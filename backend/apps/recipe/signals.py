@@ -0,0 +1,125 @@
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from apps.accounts.models import Subscription
+from .counters import count_row
+from .images import (invalidate_author, schedule_avatar_variants,
+                     schedule_recipe_variants)
+from .ingredient_index import ingredient_index
+from .models import Favorite, Ingredient, Recipe, RecipeIngredient, Tag
+from .reference import reference_data
+from .short_links import live_recipes
+from .versions import RECIPES_VERSION, bump_version, recipe_version
+
+User = get_user_model()
+
+# Поля пользователя, которые не попадают в представление рецепта.
+USER_HIDDEN_FIELDS = frozenset(
+    ('last_login', 'password', 'recipes_count', 'subscribers_count'))
+
+
+def bump_recipes(*recipe_ids):
+    """Новая версия ленты и перечисленных рецептов после коммита."""
+    def bump():
+        bump_version(RECIPES_VERSION)
+        for recipe_id in recipe_ids:
+            bump_version(recipe_version(recipe_id))
+    transaction.on_commit(bump)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Subscription)
+def count_created_row(sender, instance, created, raw=False, **kwargs):
+    """Счетчики меняются при любом создании: API, админка, ORM.
+
+    Загрузка фикстур (raw) приносит счетчики вместе с данными.
+    """
+    if created and not raw:
+        count_row(sender, instance, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Subscription)
+def count_deleted_row(sender, instance, **kwargs):
+    """В том числе при каскадном удалении вместе с пользователем."""
+    count_row(sender, instance, -1)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_reference_data(**kwargs):
+    """Сброс кэша справочников после изменения тэгов и ингредиентов."""
+    transaction.on_commit(reference_data.invalidate)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe(instance, **kwargs):
+    bump_recipes(instance.pk)
+
+
+@receiver(post_save, sender=Recipe)
+def add_live_recipe(created, **kwargs):
+    if created:
+        transaction.on_commit(live_recipes.invalidate)
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_live_recipe(**kwargs):
+    transaction.on_commit(live_recipes.invalidate)
+
+
+@receiver(post_save, sender=Recipe)
+def index_new_recipe(instance, created, **kwargs):
+    if created:
+        ingredient_index.changed(instance.pk)
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def index_recipe_ingredients(instance, **kwargs):
+    ingredient_index.changed(instance.recipe_id)
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def invalidate_recipe_ingredients(instance, **kwargs):
+    bump_recipes(instance.recipe_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags(instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        bump_recipes(instance.pk)
+    elif pk_set:
+        bump_recipes(*pk_set)
+    else:
+        bump_recipes()
+
+
+@receiver((post_save, post_delete), sender=User)
+def invalidate_author_data(instance, created=False, update_fields=None,
+                           **kwargs):
+    """Сброс кэшей рецептов автора.
+
+    Только что созданный пользователь еще не встречается ни в одном рецепте.
+    """
+    if created or (update_fields
+                   and USER_HIDDEN_FIELDS.issuperset(update_fields)):
+        return
+    transaction.on_commit(partial(invalidate_author, instance.pk))
+
+
+@receiver(post_save, sender=Recipe)
+def make_recipe_image_variants(instance, **kwargs):
+    schedule_recipe_variants(instance)
+
+
+@receiver(post_save, sender=User)
+def make_avatar_variants(instance, **kwargs):
+    schedule_avatar_variants(instance)
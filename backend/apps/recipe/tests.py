@@ -0,0 +1,302 @@
+import json
+import tempfile
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from apps.accounts.models import Subscription
+from apps.recipe.ingredient_index import ingredient_index
+from apps.recipe.models import Favorite, Ingredient, Recipe, RecipeIngredient
+from apps.recipe.short_links import (BITMAP_KEY, decode_code, encode_id,
+                                     live_recipes)
+from apps.recipe.versions import RECIPE_IDS_VERSION, get_versions
+
+User = get_user_model()
+
+
+def png_bytes(size=(10, 10)):
+    buffer = BytesIO()
+    Image.new('RGB', size).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class CountersTest(TestCase):
+    """Счетчики рецептов, избранного и подписчиков."""
+
+    client_class = APIClient
+
+    def setUp(self):
+        cache.clear()
+        self.author, self.reader = [
+            User.objects.create_user(
+                email=f'{name}@example.com', username=name,
+                first_name=name, last_name=name)
+            for name in ('author', 'reader')]
+        self.recipe = self.create_recipe()
+
+    def create_recipe(self):
+        return Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Описание',
+            cooking_time=10, image='recipes/images/test.png',
+            image_variants={'source': 'recipes/images/test.png'})
+
+    def assert_counters(self, recipes, favorites, subscribers):
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, recipes)
+        self.assertEqual(self.author.subscribers_count, subscribers)
+        if favorites is not None:
+            self.recipe.refresh_from_db()
+            self.assertEqual(self.recipe.favorites_count, favorites)
+
+    def test_recipe_create_and_delete(self):
+        self.assert_counters(1, 0, 0)
+        other = self.create_recipe()
+        self.assert_counters(2, 0, 0)
+        other.delete()
+        self.assert_counters(1, 0, 0)
+
+    def test_favorite_and_subscription(self):
+        favorite = Favorite.objects.create(user=self.reader,
+                                           recipe=self.recipe)
+        subscription = Subscription.objects.create(subscriber=self.reader,
+                                                   target=self.author)
+        self.assert_counters(1, 1, 1)
+        favorite.delete()
+        Subscription.objects.filter(pk=subscription.pk).delete()
+        self.assert_counters(1, 0, 0)
+
+    def test_api_changes_counters_once(self):
+        self.client.force_authenticate(self.reader)
+        response = self.client.post(f'/api/recipes/{self.recipe.id}/favorite/')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        self.assertEqual(response.status_code, 201)
+        self.assert_counters(1, 1, 1)
+        response = self.client.delete(
+            f'/api/recipes/{self.recipe.id}/favorite/')
+        self.assertEqual(response.status_code, 204)
+        response = self.client.delete(
+            f'/api/users/{self.author.id}/subscribe/')
+        self.assertEqual(response.status_code, 204)
+        self.assert_counters(1, 0, 0)
+
+    def test_user_delete_cascades(self):
+        Favorite.objects.create(user=self.reader, recipe=self.recipe)
+        Subscription.objects.create(subscriber=self.reader,
+                                    target=self.author)
+        self.reader.delete()
+        self.assert_counters(1, 0, 0)
+        self.recipe.delete()
+        self.assert_counters(0, None, 0)
+
+    def test_recount_fixes_drift(self):
+        Favorite.objects.create(user=self.reader, recipe=self.recipe)
+        User.objects.filter(pk=self.author.pk).update(
+            recipes_count=5, subscribers_count=3)
+        Recipe.objects.filter(pk=self.recipe.pk).update(favorites_count=0)
+        output = StringIO()
+        call_command('recount', stdout=output)
+        self.assertIn('user.recipes_count: исправлено записей 1',
+                      output.getvalue())
+        self.assertIn('recipe.favorites_count: исправлено записей 1',
+                      output.getvalue())
+        self.assert_counters(1, 1, 0)
+
+
+@skipUnless(connection.vendor == 'postgresql',
+            'Планы запросов проверяются только в PostgreSQL.')
+class QueryPlansTest(TestCase):
+    """Горячие запросы идут по индексам: check_query_plans без ошибок."""
+
+    def test_hot_queries_use_indexes(self):
+        output = StringIO()
+        call_command('check_query_plans', stdout=output)
+        self.assertIn('Все запросы идут по индексам.', output.getvalue())
+
+
+class LoadDbTest(TestCase):
+    """Загрузка рецептов командой load_db."""
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = Path(self.directory.name)
+        settings = override_settings(MEDIA_ROOT=self.path / 'media',
+                                     IMAGE_VARIANTS_ASYNC=False)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Автор', last_name='Автор')
+        (self.path / 'ingredients.csv').write_text(
+            'мука,г\nсоль,г\n', encoding='utf-8')
+        (self.path / 'tags.json').write_text(json.dumps(
+            [{'name': 'Завтрак', 'slug': 'breakfast'}]), encoding='utf-8')
+        (self.path / 'dish.png').write_bytes(png_bytes())
+        (self.path / 'recipes.ndjson').write_text('\n'.join(
+            json.dumps({
+                'author': self.author.email, 'name': f'Рецепт {number}',
+                'text': 'Описание', 'cooking_time': 10, 'image': 'dish.png',
+                'tags': ['breakfast'],
+                'ingredients': [{'name': 'мука', 'amount': 100},
+                                {'name': 'соль', 'amount': 5}],
+            }) for number in range(4)
+        ), encoding='utf-8')
+
+    def load(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command(
+                'load_db', ingredients=self.path / 'ingredients.csv',
+                tags=self.path / 'tags.json',
+                recipes=self.path / 'recipes.ndjson', batch_size=3,
+                stdout=StringIO())
+
+    def test_recipes_count_and_image_variants(self):
+        self.load()
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 4)
+        for recipe in Recipe.objects.all():
+            self.assertEqual(recipe.image_variants['source'],
+                             recipe.image.name)
+            self.assertTrue(recipe.image_variants['sizes'])
+
+    def test_repeated_load_keeps_counter(self):
+        self.load()
+        self.load()
+        self.author.refresh_from_db()
+        self.assertEqual(Recipe.objects.count(), 4)
+        self.assertEqual(self.author.recipes_count, 4)
+
+
+class IngredientIndexTest(TestCase):
+    """Поиск рецептов по ингредиентам в памяти процесса."""
+
+    def setUp(self):
+        cache.clear()
+        ingredient_index._state = None
+        self.addCleanup(setattr, ingredient_index, '_state', None)
+        author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Автор', last_name='Автор')
+        self.flour, self.salt, self.milk = Ingredient.objects.bulk_create([
+            Ingredient(name=name, measurement_unit='г')
+            for name in ('мука', 'соль', 'молоко')])
+        self.pancakes, self.bread = [
+            Recipe.objects.create(
+                author=author, name=name, text='Описание', cooking_time=10,
+                image='recipes/images/test.png',
+                image_variants={'source': 'recipes/images/test.png'})
+            for name in ('Блины', 'Хлеб')]
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=self.pancakes, ingredient=self.flour,
+                             amount=100),
+            RecipeIngredient(recipe=self.pancakes, ingredient=self.milk,
+                             amount=200),
+            RecipeIngredient(recipe=self.bread, ingredient=self.flour,
+                             amount=300),
+        ])
+
+    def test_ranking(self):
+        self.assertEqual(ingredient_index.search([self.flour.id]), [
+            (self.bread.id, 1.0), (self.pancakes.id, 0.5)])
+        self.assertEqual(ingredient_index.search([self.salt.id]), [])
+
+    def test_incremental_update(self):
+        state = ingredient_index.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeIngredient.objects.create(
+                recipe=self.bread, ingredient=self.salt, amount=5)
+        self.assertEqual(ingredient_index.search([self.flour.id]), [
+            (self.bread.id, 0.5), (self.pancakes.id, 0.5)])
+        self.assertEqual(ingredient_index.search([self.salt.id]),
+                         [(self.bread.id, 0.5)])
+        self.assertIs(ingredient_index.get(), state)
+
+    @override_settings(INGREDIENT_SEARCH_CACHE_ENTRIES=3)
+    def test_memo_bounded_by_entries(self):
+        state = ingredient_index.get()
+        flour, milk = {self.flour.id}, {self.milk.id}
+        both = flour | milk
+        ingredient_index.search(flour)
+        ingredient_index.search(milk)
+        self.assertEqual(state.results_size, 3)
+        ingredient_index.search(both)
+        self.assertEqual(list(state.results), [frozenset(milk),
+                                               frozenset(both)])
+        self.assertEqual(state.results_size, 3)
+        with self.settings(INGREDIENT_SEARCH_CACHE_ENTRIES=1):
+            ingredient_index.search(flour)
+        self.assertNotIn(frozenset(flour), state.results)
+
+
+class ShortLinksTest(TestCase):
+    """Короткие коды и битовая карта существующих рецептов."""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Автор', last_name='Автор')
+
+    def create_recipe(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Recipe.objects.create(
+                author=self.author, name='Рецепт', text='Описание',
+                cooking_time=10, image='recipes/images/test.png',
+                image_variants={'source': 'recipes/images/test.png'})
+
+    def test_codes(self):
+        for recipe_id in (1, 51, 52, 1000, 10 ** 9):
+            code = encode_id(recipe_id)
+            self.assertTrue(code.isalpha())
+            self.assertEqual(decode_code(code), recipe_id)
+        self.assertEqual(decode_code('123'), 123)
+        self.assertIsNone(decode_code('a1'))
+
+    def test_bitmap_follows_create_and_delete(self):
+        recipe = self.create_recipe()
+        self.assertIn(recipe.id, live_recipes)
+        self.assertNotIn(recipe.id + 1, live_recipes)
+        other = self.create_recipe()
+        self.assertIn(other.id, live_recipes)
+        recipe_id = recipe.id
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+        self.assertNotIn(recipe_id, live_recipes)
+        self.assertIn(other.id, live_recipes)
+
+    def test_one_shared_bitmap(self):
+        recipes = [self.create_recipe() for _ in range(3)]
+        self.assertIn(recipes[-1].id, live_recipes)
+        version = get_versions(RECIPE_IDS_VERSION)[RECIPE_IDS_VERSION]
+        version_stored, bitmap = cache.get(BITMAP_KEY)
+        self.assertEqual(version_stored, version)
+        # Другой процесс берет карту текущей версии из общего кэша.
+        live_recipes._state = (None, b'')
+        with self.assertNumQueries(0):
+            self.assertIn(recipes[0].id, live_recipes)
+        # Карта прошлой версии в кэше строится заново.
+        cache.set(BITMAP_KEY, (version - 1, bitmap), None)
+        live_recipes._state = (None, b'')
+        with self.assertNumQueries(1):
+            self.assertIn(recipes[0].id, live_recipes)
+        self.assertEqual(cache.get(BITMAP_KEY)[0], version)
+
+    def test_redirect(self):
+        recipe = self.create_recipe()
+        for code in (encode_id(recipe.id), str(recipe.id)):
+            response = self.client.get(f'/s/{code}/')
+            self.assertEqual(response.status_code, 302)
+            self.assertEqual(response['Location'], f'/recipes/{recipe.id}/')
+            self.assertIn('public', response['Cache-Control'])
+        response = self.client.get(f'/s/{encode_id(recipe.id + 1)}/')
+        self.assertEqual(response.status_code, 400)
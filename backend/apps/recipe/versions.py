@@ -0,0 +1,61 @@
+import time
+
+from django.core.cache import cache
+
+REFERENCE_VERSION = 'reference_data_version'
+RECIPES_VERSION = 'recipes_version'
+AUTH_VERSION = 'auth_tokens_version'
+RECIPE_IDS_VERSION = 'recipe_ids_version'
+INGREDIENT_INDEX_VERSION = 'ingredient_index_version'
+
+
+def recipe_version(recipe_id):
+    """Ключ версии отдельного рецепта."""
+    return f'recipe_version_{recipe_id}'
+
+
+def author_version(author_id):
+    """Ключ версии данных автора, встроенных в его рецепты."""
+    return f'author_version_{author_id}'
+
+
+def get_versions(*keys):
+    """Текущие номера версий из общего кэша одним запросом."""
+    if not keys:
+        return {}
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return versions
+
+
+async def aget_versions(*keys):
+    """Асинхронный вариант get_versions."""
+    if not keys:
+        return {}
+    versions = await cache.aget_many(keys)
+    for key in keys:
+        if key not in versions:
+            await cache.aadd(key, time.time_ns(), timeout=None)
+            versions[key] = await cache.aget(key)
+    return versions
+
+
+def bump_version(key):
+    """Новая версия данных; отсутствующий ключ заводится заново."""
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def bump_author(author_id, in_feed):
+    """Новая версия данных автора.
+
+    Ленты сбрасываются, только если в них есть рецепты автора.
+    """
+    bump_version(author_version(author_id))
+    if in_feed:
+        bump_version(RECIPES_VERSION)
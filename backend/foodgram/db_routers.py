@@ -0,0 +1,54 @@
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+use_replica = ContextVar('use_replica', default=False)
+
+
+class ReplicaRouter:
+    """Чтение на реплике во время безопасных запросов, запись в основную."""
+
+    def db_for_read(self, model, **hints):
+        if use_replica.get() and not connections['default'].in_atomic_block:
+            return 'replica'
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == 'default'
+
+
+class ReplicaMiddleware:
+    """Отмечает GET, HEAD и OPTIONS запросы для чтения с реплики."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = use_replica.set(request.method in SAFE_METHODS)
+        try:
+            return self.get_response(request)
+        finally:
+            use_replica.reset(token)
+
+    async def __acall__(self, request):
+        token = use_replica.set(request.method in SAFE_METHODS)
+        try:
+            return await self.get_response(request)
+        finally:
+            use_replica.reset(token)
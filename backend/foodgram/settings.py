@@ -64,6 +64,15 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
 
+# Через pgbouncer в режиме transaction нельзя использовать серверные
+# курсоры и параметры запуска соединения, statement_timeout тогда
+# задается для роли в самой базе.
+DB_PGBOUNCER = os.getenv('DB_PGBOUNCER', 'False').lower() == 'true'
+# Под ASGI синхронный код запросов выполняется в разных потоках, поэтому
+# постоянные соединения по умолчанию выключены в пользу pgbouncer.
+ASGI_MODE = os.getenv('SERVER_MODE', 'wsgi') == 'asgi'
+DB_STATEMENT_TIMEOUT = int(os.getenv('DB_STATEMENT_TIMEOUT', 0))
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -71,10 +80,61 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', 'django'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', ''),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'PORT': os.getenv('DB_PORT', 5432),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE',
+                                      0 if ASGI_MODE else 60)),
+        'CONN_HEALTH_CHECKS': os.getenv(
+            'DB_CONN_HEALTH_CHECKS', 'True').lower() == 'true',
+        'DISABLE_SERVER_SIDE_CURSORS': DB_PGBOUNCER,
+        'OPTIONS': {},
     }
 }
 
+if DB_STATEMENT_TIMEOUT and not DB_PGBOUNCER:
+    DATABASES['default']['OPTIONS']['options'] = (
+        f'-c statement_timeout={DB_STATEMENT_TIMEOUT}')
+
+if os.getenv('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.getenv('DB_REPLICA_HOST'),
+        'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['foodgram.db_routers.ReplicaRouter']
+    MIDDLEWARE.insert(0, 'foodgram.db_routers.ReplicaMiddleware')
+
+REDIS_URL = os.getenv('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    # Кэш в памяти процесса подходит только для разработки, тестов и
+    # одного процесса gunicorn, иначе gunicorn.conf.py не даст запуститься.
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Первым идет алгоритм для новых паролей, остальные нужны для проверки
+# старых хэшей, которые пересчитываются при входе.
+PASSWORD_HASHER_CLASSES = {
+    'argon2': 'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'scrypt': 'django.contrib.auth.hashers.ScryptPasswordHasher',
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+}
+PASSWORD_HASHER = os.getenv('PASSWORD_HASHER', 'pbkdf2')
+PASSWORD_HASHERS = [PASSWORD_HASHER_CLASSES[PASSWORD_HASHER]] + [
+    hasher for name, hasher in PASSWORD_HASHER_CLASSES.items()
+    if name != PASSWORD_HASHER
+]
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -104,16 +164,42 @@ STATIC_ROOT = BASE_DIR / 'backend_static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+IMAGE_VARIANTS = {
+    'recipe': {'card': (480, 320), 'detail': (1200, 800)},
+    'avatar': {'avatar': (160, 160)},
+}
+IMAGE_VARIANTS_QUALITY = 85
+IMAGE_VARIANTS_ASYNC = os.getenv(
+    'IMAGE_VARIANTS_ASYNC', 'True').lower() == 'true'
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+IMAGE_UPLOAD_MAX_SIZE = 5 * 1024 * 1024
+IMAGE_UPLOAD_MAX_SIDE = 6000
+IMAGE_UPLOAD_CHUNK_SIZE = 64 * 1024
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'accounts.User'
 
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'apps': {
+            'handlers': ['console'],
+            'level': os.getenv('LOG_LEVEL', 'INFO'),
+        },
+    },
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'apps.api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
@@ -143,3 +229,21 @@ MIN_AMOUNT = 1
 MIN_TIME = 1
 MAX_LENTHG_RECIPE = 256
 MIN_AMOUNT = 1
+MAX_AUTOCOMPLETE_ITEMS = 10
+EXPORT_CHUNK_SIZE = 500
+IMPORT_BATCH_SIZE = 200
+COUNT_CACHE_TIMEOUT = 60
+RESPONSE_CACHE_TIMEOUT = 300
+SHORT_LINK_CACHE_TIMEOUT = 300
+INGREDIENT_INDEX_MAX_LAG = 1000
+INGREDIENT_INDEX_LOG_TIMEOUT = 3600
+MAX_SEARCH_INGREDIENTS = 50
+# Пар (рецепт, доля) во всех запомненных ответах поиска по ингредиентам,
+# около 100 байт на пару.
+INGREDIENT_SEARCH_CACHE_ENTRIES = 200000
+AUTH_TOKEN_CACHE_SIZE = 1024
+AUTH_TOKEN_CACHE_TIMEOUT = 60
+AUTH_TOKEN_CACHE_STATS_EVERY = int(
+    os.getenv('AUTH_TOKEN_CACHE_STATS_EVERY', 10000))
+LOGIN_HASH_CONCURRENCY = int(os.getenv('LOGIN_HASH_CONCURRENCY', 2))
+LOGIN_HASH_TIMEOUT = 5
@@ -1,15 +1,19 @@
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
 
-from apps.api.views import redirect_to_recipe
+from apps.api import async_views, views
+
+# Под WSGI асинхронный обработчик выполнялся бы через async_to_sync.
+redirect_to_recipe = (async_views.redirect_to_recipe if settings.ASGI_MODE
+                      else views.redirect_to_recipe)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('apps.api.urls')),
-    path('s/<int:recipe_id>/', redirect_to_recipe,
-         name='redirect_to_recipe'),
+    re_path(r'^s/(?P<code>[0-9]+|[A-Za-z]+)/?$', redirect_to_recipe,
+            name='redirect_to_recipe'),
 ]
 
 if settings.DEBUG:
@@ -0,0 +1,24 @@
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8080')
+workers = int(os.getenv('GUNICORN_WORKERS',
+                        multiprocessing.cpu_count() * 2 + 1))
+# Версии кэшей, снимок справочников, битовая карта рецептов и индекс
+# ингредиентов согласуются между процессами только через общий кэш.
+if workers > 1 and not os.getenv('REDIS_URL'):
+    raise RuntimeError(
+        f'Для {workers} процессов нужен общий кэш: задайте REDIS_URL '
+        'или GUNICORN_WORKERS=1.')
+# Каждый поток держит свое соединение с базой при CONN_MAX_AGE > 0.
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+if os.getenv('SERVER_MODE', 'wsgi') == 'asgi':
+    wsgi_app = 'foodgram.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'foodgram.wsgi:application'
+    worker_class = 'gthread' if threads > 1 else 'sync'
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10